@@ -1,5 +1,7 @@
 import os
+import asyncio
 import logging
+import importlib
 import traceback
 
 import discord
@@ -9,18 +11,25 @@ from dotenv import load_dotenv
 from bot.bot import MasarykBOT
 from bot.cogs.utils.logging import setup_logging
 from bot.cogs.utils.db import Database
+from bot.cogs.utils.ingest import IngestWorker
 
 
 initail_cogs = [
     "bot.cogs.hall_of_fame",
     "bot.cogs.verification",
     "bot.cogs.cog_manager",
+    "bot.cogs.profiler",
     "bot.cogs.leaderboard",
     "bot.cogs.rolemenu",
     "bot.cogs.subject",
     "bot.cogs.errors",
+    "bot.cogs.export",
     "bot.cogs.logger",
+    "bot.cogs.paste",
     "bot.cogs.rules",
+    "bot.cogs.search",
+    "bot.cogs.stats",
+    "bot.cogs.activity",
     "bot.cogs.admin",
     "bot.cogs.eval",
     "bot.cogs.help",
@@ -28,6 +37,44 @@ initail_cogs = [
     "bot.cogs.fun"
 ]
 
+async def import_extensions(loop):
+    """
+    import the extension modules in worker threads, setup() runs later on the loop,
+    a failing import does not stop the others but its error is logged
+    """
+    log = logging.getLogger()
+
+    results = await asyncio.gather(*(loop.run_in_executor(None, importlib.import_module, extension)
+                                     for extension in initail_cogs),
+                                   return_exceptions=True)
+    for extension, result in zip(initail_cogs, results):
+        if isinstance(result, BaseException):
+            log.error("Failed to import extension %s.", extension, exc_info=result)
+
+
+async def start(bot):
+    """
+    connect the database pool, log in to discord and import the extensions
+    concurrently, then load the cogs and connect to the gateway
+    """
+    log = logging.getLogger()
+
+    bot.prepare()
+    bot.db, *_ = await asyncio.gather(
+        Database.create(os.getenv("POSTGRES")),
+        bot.login(os.getenv("TOKEN")),
+        import_extensions(bot.loop))
+
+    for extension in initail_cogs:
+        try:
+            bot.load_extension(extension)
+        except Exception:
+            log.error('Failed to load extension %s.', extension)
+            traceback.print_exc()
+
+    await bot.connect(reconnect=True)
+
+
 if __name__ == "__main__":
     load_dotenv()
     setup_logging()
@@ -42,25 +89,44 @@ if __name__ == "__main__":
         log.exception("discord bot token is required to run the bot, exiting...")
         exit()
 
+    # lean cache: no presences (!info shows every member offline), members are chunked
+    # per guild when a cog needs them and stay cached until restart (see README)
+    lean_cache = os.getenv("LEAN_CACHE", "0") == "1"
+
     intents = discord.Intents(
         guilds=True,
         guild_messages=True,
         members=True,
-        presences = True,
+        presences = not lean_cache,
         emojis=True,
         guild_reactions=True)
 
+    if lean_cache:
+        cache_options = dict(member_cache_flags=discord.MemberCacheFlags(online=False, voice=False, joined=True),
+                             chunk_guilds_at_startup=False)
+    else:
+        cache_options = dict(member_cache_flags=discord.MemberCacheFlags.from_intents(intents))
+
+    # the shard count is taken from discord when not set
+    shard_count = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+
     bot = MasarykBOT(command_prefix=commands.when_mentioned_or("!"),
+                     shard_count=shard_count,
                      intents=intents,
-                     allowed_mentions=discord.AllowedMentions(roles=False, everyone=False, users=True),)
-
-    bot.db = Database.connect(os.getenv("POSTGRES"))
+                     allowed_mentions=discord.AllowedMentions(roles=False, everyone=False, users=True),
+                     **cache_options)
 
-    for extension in initail_cogs:
-        try:
-            bot.load_extension(extension)
-        except Exception:
-            log.error('Failed to load extension %s.', extension)
-            traceback.print_exc()
+    # the archive is prepared and written by a separate process
+    ingest_worker = IngestWorker(os.getenv("POSTGRES"))
+    ingest_worker.start()
+    bot.ingest = ingest_worker.client
 
-    bot.run(os.getenv("TOKEN"))
+    loop = bot.loop
+    try:
+        loop.run_until_complete(start(bot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(bot.close())
+        ingest_worker.stop()
+        log.info("exiting, bye")
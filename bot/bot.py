@@ -3,10 +3,14 @@ import logging
 import traceback
 from datetime import datetime, timezone
 from collections import Counter
+from contextlib import nullcontext
 
+import aiohttp
 from discord.ext import commands
 
-from bot.cogs.utils import context, constants
+from bot.cogs.utils import context, constants, metrics
+from bot.cogs.utils.router import EventRouter
+from bot.cogs.utils.scheduler import BackgroundScheduler, is_interactive
 
 DESCRIPTION = """
 $ Hello
@@ -14,24 +18,134 @@ $ Hello
 
 log = logging.getLogger(__name__)
 
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 10
+HTTP_KEEPALIVE_TIMEOUT = 60.0
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=60.0, connect=10.0)
 
-class MasarykBOT(commands.Bot):
+LOOP_LAG_INTERVAL = 1.0
+
+
+class ShardHealth:
+    """gateway state of one shard, updated from the shard events"""
+
+    __slots__ = ("status", "since", "disconnects")
+
+    def __init__(self):
+        self.status = "connecting"
+        self.since = datetime.utcnow()
+        self.disconnects = 0
+
+    def update(self, status):
+        self.status = status
+        self.since = datetime.utcnow()
+
+
+class MasarykBOT(commands.AutoShardedBot):
     def __init__(self, *args, description=DESCRIPTION, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.spam_control = commands.CooldownMapping.from_cooldown(10, 12.0, commands.BucketType.user)
         self._auto_spam_count = Counter()
+        self._prefixes = None
 
+        self.router = EventRouter()
+        self.scheduler = BackgroundScheduler()
         self.db = None
+        self.ingest = None
+        self.session = None
         self.uptime = None
+        self.loop_lag = 0.0
+        self.shard_health = {}
+
+        metrics.REGISTRY.gauge("event_loop_lag_last_seconds", lambda: self.loop_lag,
+                               "how late the last event loop lag probe woke up")
 
     async def on_ready(self):
         if self.uptime is None:
             self.uptime = datetime.utcnow()
 
+        self._prefixes = None
         self.intorduce()
 
+    def get_shard_health(self, shard_id):
+        if shard_id not in self.shard_health:
+            self.shard_health[shard_id] = ShardHealth()
+        return self.shard_health[shard_id]
+
+    async def on_shard_connect(self, shard_id):
+        self.get_shard_health(shard_id).update("connected")
+
+    async def on_shard_ready(self, shard_id):
+        self.get_shard_health(shard_id).update("ready")
+        log.info("shard %d is ready with %d guilds", shard_id, len(self.shard_guilds(shard_id)))
+
+    async def on_shard_resumed(self, shard_id):
+        self.get_shard_health(shard_id).update("ready")
+
+    async def on_shard_disconnect(self, shard_id):
+        health = self.get_shard_health(shard_id)
+        health.update("disconnected")
+        health.disconnects += 1
+        metrics.REGISTRY.counter("gateway_disconnects", "gateway disconnects", shard=shard_id).inc()
+        log.warning("shard %d disconnected", shard_id)
+
+    def shard_guilds(self, shard_id=None):
+        """the guilds served by the shard, all guilds when shard_id is None"""
+        if shard_id is None:
+            return self.guilds
+        return [guild for guild in self.guilds if guild.shard_id == shard_id]
+
+    async def ensure_chunked(self, guild):
+        """
+        with the lean cache the members are not chunked at startup,
+        cogs iterating guild.members call this first
+
+        a chunked guild keeps all its members cached (and up to date
+        through the members intent) until the bot restarts,
+        discord.py has no way to release them again
+        """
+        if not guild.chunked:
+            log.info("chunking members of %s", guild)
+            await guild.chunk(cache=True)
+
+    async def get_prefixes(self, message):
+        """
+        the prefixes of this bot (! and the mention) do not depend on the message,
+        so they are resolved once and reused for every message
+        """
+        if self._prefixes is None:
+            prefixes = await self.get_prefix(message)
+            self._prefixes = (prefixes,) if isinstance(prefixes, str) else tuple(prefixes)
+        return self._prefixes
+
+    async def is_possible_command(self, message):
+        """
+        cheap check whether the message starts with a prefix followed by a known command name,
+        so that plain chat messages skip building the Context
+        """
+        prefixes = await self.get_prefixes(message)
+        content = message.content
+        if not content.startswith(prefixes):
+            return False
+
+        for prefix in prefixes:
+            if not content.startswith(prefix):
+                continue
+
+            # like get_context, whitespace after the prefix is only skipped with strip_after_prefix
+            rest = content[len(prefix):]
+            invoker = rest.split(maxsplit=1)
+            if not invoker or (rest[0].isspace() and not self.strip_after_prefix):
+                continue
+            if invoker[0] in self.all_commands:
+                return True
+        return False
+
     async def process_commands(self, message):
+        if not await self.is_possible_command(message):
+            return
+
         ctx = await self.get_context(message, cls=context.Context)
 
         if ctx.command is None:
@@ -54,7 +168,11 @@ class MasarykBOT(commands.Bot):
         self._auto_spam_count.pop(author_id, None)
 
         log.info("user %s used command: %s", message.author, message.content)
-        await self.invoke(ctx)
+        histogram = metrics.REGISTRY.histogram("command_seconds", "command invocation latency",
+                                               command=ctx.command.qualified_name)
+        pause = self.scheduler.interactive() if is_interactive(ctx.command) else nullcontext()
+        with pause, histogram.time():
+            await self.invoke(ctx)
 
     async def on_message(self, message):
         if message.author.bot:
@@ -63,11 +181,63 @@ class MasarykBOT(commands.Bot):
             return
         await self.process_commands(message)
 
+    async def start(self, *args, **kwargs):
+        self.prepare()
+        await super().start(*args, **kwargs)
+
+    def prepare(self):
+        """set up the shared resources, called before connecting to the gateway"""
+        if self.session is None:
+            self.session = self.create_http_session()
+            self.loop.create_task(self.monitor_loop_lag())
+        self.scheduler.start(self.loop)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        histogram = metrics.REGISTRY.histogram("event_handler_seconds", "time spent in the event handlers",
+                                               event=event_name, handler=coro.__qualname__)
+        with histogram.time():
+            await super()._run_event(coro, event_name, *args, **kwargs)
+
+    async def monitor_loop_lag(self):
+        """sleep for a fixed interval and measure how much later than expected the loop woke us up"""
+        histogram = metrics.REGISTRY.histogram("event_loop_lag_seconds", "event loop lag")
+        while not self.is_closed():
+            start = self.loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(self.loop.time() - start - LOOP_LAG_INTERVAL, 0.0)
+            histogram.observe(self.loop_lag)
+
+    async def close(self):
+        self.scheduler.stop()
+        await super().close()
+        if self.session is not None:
+            await self.session.close()
+
+    @staticmethod
+    def create_http_session():
+        """
+        shared http client for the cogs, keeps the connections alive
+        so that repeated requests to the same host skip the handshake
+        """
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT,
+                                         limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                                         keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+
+    def dispatch(self, event_name, *args, **kwargs):
+        super().dispatch(event_name, *args, **kwargs)
+
+        for handler in self.router.handlers(event_name, *args):
+            self._schedule_event(handler, "on_" + event_name, *args, **kwargs)
+
     def add_cog(self, cog: commands.Cog) -> None:
         super().add_cog(cog)
+        self.router.add_cog(cog)
         log.info("Cog loaded: %s", cog.qualified_name)
 
     def remove_cog(self, name: str) -> None:
+        if (cog := self.get_cog(name)) is not None:
+            self.router.remove_cog(cog)
         super().remove_cog(name)
         log.info("Cog unloaded: %s", name)
 
@@ -0,0 +1,167 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord import TextChannel
+from discord.ext import tasks, commands
+
+from .utils import scheduler
+
+DAY = 86400
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MOVING_AVERAGE_WINDOW = 7
+TOP_CHANNELS = 5
+ROLLUP_LOOKBACK = timedelta(hours=3)  # recounted every hour, covers the messages written late
+
+
+def to_arrays(rows, *columns):
+    import numpy as np
+    return [np.fromiter((row[column] for row in rows), dtype=np.int64, count=len(rows)) for column in columns]
+
+
+def hour_of_week(weekdays, hours, counts):
+    """7x24 matrix of the counts by weekday (monday first) and hour of day, missing slots are 0"""
+    import numpy as np
+    matrix = np.zeros((7, 24), dtype=np.int64)
+    matrix[weekdays, hours] = counts
+    return matrix
+
+
+def daily(timestamps, counts, start, days):
+    """counts summed per day since the start (epoch seconds), days without activity are 0"""
+    import numpy as np
+    index = (timestamps - start) // DAY
+    mask = (index >= 0) & (index < days)
+    return np.bincount(index[mask], weights=counts[mask], minlength=days)
+
+
+def moving_average(values, window=MOVING_AVERAGE_WINDOW):
+    """trailing moving average, the first window - 1 values are nan"""
+    import numpy as np
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumsum = np.cumsum(np.insert(values.astype(float), 0, 0.0))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+class Activity(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.refresh.start()
+
+    def cog_unload(self):
+        self.refresh.cancel()
+
+    @tasks.loop(hours=1)
+    async def refresh(self):
+        now = datetime.utcnow()
+        self.bot.scheduler.submit("activity.refresh", lambda: self.bot.db.activity.rollup(now - ROLLUP_LOOKBACK, now),
+                                  priority=scheduler.LOW)
+
+    @refresh.before_loop
+    async def before_refresh(self):
+        await self.bot.wait_until_ready()
+
+    @staticmethod
+    def since(days):
+        return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+    async def send_chart(self, ctx, render, *args):
+        image = await self.bot.loop.run_in_executor(None, render, *args)
+        await ctx.send(file=discord.File(image, filename="activity.png"))
+
+    @staticmethod
+    def render_figure(figure):
+        image = io.BytesIO()
+        figure.savefig(image, format="png", dpi=100, bbox_inches="tight")
+        image.seek(0)
+        return image
+
+    @staticmethod
+    def figure(**kwargs):
+        # pyplot keeps global state, so the figures rendered in the executor are created directly
+        from matplotlib.figure import Figure
+        figure = Figure(**kwargs)
+        return figure, figure.subplots()
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    @commands.cooldown(rate=1, per=30.0, type=commands.BucketType.user)
+    async def activity(self, ctx, channel: TextChannel = None, days: int = 365):
+        """
+        Show when the guild (or the channel) is active during the week
+
+        !activity [#channel] [days]
+        !activity channels [days]
+        !activity users [days]
+        """
+        rows = await self.bot.db.activity.hour_of_week(ctx.guild.id, self.since(days), channel.id if channel else None)
+        weekdays, hours, counts = to_arrays(rows, "weekday", "hour", "messages_sent")
+        title = f"Messages per hour of week in {'#' + channel.name if channel else ctx.guild.name}, last {days} days"
+        await self.send_chart(ctx, self.render_hour_of_week, hour_of_week(weekdays, hours, counts), title)
+
+    def render_hour_of_week(self, matrix, title):
+        figure, axes = self.figure(figsize=(10, 3.5))
+        image = axes.imshow(matrix, aspect="auto", cmap="YlOrRd")
+        axes.set_yticks(range(7))
+        axes.set_yticklabels(WEEKDAYS)
+        axes.set_xticks(range(0, 24, 2))
+        axes.set_xlabel("hour")
+        axes.set_title(title)
+        figure.colorbar(image, ax=axes)
+        return self.render_figure(figure)
+
+    @activity.command(name="channels")
+    @commands.guild_only()
+    async def activity_channels(self, ctx, days: int = 180):
+        """Messages per day in the busiest channels"""
+        since = self.since(days)
+        rows = await self.bot.db.activity.daily_channels(ctx.guild.id, since)
+        channel_ids, timestamps, counts = to_arrays(rows, "channel_id", "day", "messages_sent")
+
+        start = int(since.replace(tzinfo=timezone.utc).timestamp())
+        series = {}
+        for channel_id in self.top_channels(channel_ids, counts):
+            mask = channel_ids == channel_id
+            channel = ctx.guild.get_channel(int(channel_id))
+            series[f"#{channel.name}" if channel else str(channel_id)] = daily(timestamps[mask], counts[mask], start, days)
+
+        await self.send_chart(ctx, self.render_series, series, since,
+                              f"Messages per day ({MOVING_AVERAGE_WINDOW} day average)")
+
+    @staticmethod
+    def top_channels(channel_ids, counts, limit=TOP_CHANNELS):
+        import numpy as np
+        unique, inverse = np.unique(channel_ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=counts)
+        return unique[np.argsort(totals)[::-1][:limit]]
+
+    @activity.command(name="users")
+    @commands.guild_only()
+    async def activity_users(self, ctx, days: int = 365):
+        """Active users per day"""
+        since = self.since(days)
+        rows = await self.bot.db.activity.daily_users(ctx.guild.id, since)
+        day, users = to_arrays(rows, "day", "active_users")
+
+        start = int(since.replace(tzinfo=timezone.utc).timestamp())
+        series = {"active users": daily(day, users, start, days)}
+        await self.send_chart(ctx, self.render_series, series, since,
+                              f"Active users per day ({MOVING_AVERAGE_WINDOW} day average)")
+
+    def render_series(self, series, since, title):
+        import numpy as np
+
+        figure, axes = self.figure(figsize=(10, 4))
+        for label, values in series.items():
+            dates = np.arange(np.datetime64(since.date()), np.datetime64(since.date()) + len(values))
+            axes.plot(dates, moving_average(values), label=label)
+        axes.set_title(title)
+        axes.legend(loc="upper left")
+        figure.autofmt_xdate()
+        return self.render_figure(figure)
+
+
+def setup(bot):
+    bot.add_cog(Activity(bot))
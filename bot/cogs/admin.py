@@ -64,6 +64,25 @@ class Admin(commands.Cog):
                 file.write(content)
             await ctx.send(file=discord.File(filename))
 
+    @commands.group(invoke_without_command=True)
+    @has_permissions(administrator=True)
+    async def jobs(self, ctx):
+        """List the queued and running background jobs"""
+        scheduler = self.bot.scheduler
+        rows = [f"`{job.name}` priority {job.priority}" + (" (running)" if job.running else "")
+                for job in sorted(scheduler.jobs.values(), key=lambda job: (not job.running, job.priority))]
+        # this command is running too
+        paused = " (paused while commands run)" if scheduler.commands_running > 1 else ""
+        await ctx.send_embed("\n".join(rows) or "no background jobs", name="Background jobs" + paused)
+
+    @jobs.command(name="cancel")
+    @has_permissions(administrator=True)
+    async def jobs_cancel(self, ctx, name):
+        if self.bot.scheduler.cancel(name):
+            await ctx.send_success(f"cancelled {name}")
+        else:
+            await ctx.send_error(f"no background job named {name}")
+
 
 def setup(bot):
     bot.add_cog(Admin(bot))
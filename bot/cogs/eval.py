@@ -1,8 +1,13 @@
 import json
-import aiohttp
 
 from discord.ext import commands
 
+from .utils.cache import LRUCache, content_key, has_nocache_marker
+
+
+RESULT_CACHE_BYTES = 4 * 1024 * 1024
+RESULT_CACHE_TTL = 60 * 60
+
 def get_cmds():
     cmds = {
         'cpp': 'g++ -std=c++1z -O2 -Wall -Wextra -pedantic -pthread main.cpp -lstdc++fs && ./a.out',
@@ -50,6 +55,7 @@ class CodeBlock:
 class Eval(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.results = LRUCache(max_bytes=RESULT_CACHE_BYTES, ttl=RESULT_CACHE_TTL)
 
     @commands.command(name="eval", aliases=["e", "coliru"])
     @commands.cooldown(1, 15, commands.BucketType.user)
@@ -73,36 +79,47 @@ class Eval(commands.Cog):
         data = json.dumps(payload)
 
         async with ctx.typing():
-            async with aiohttp.ClientSession() as session:
-                result = await self.coliru_compile(session, data)
-                if result:
-                    await ctx.safe_send(result)
-                else:
-                    await ctx.send("no result")
+            result = await self.cached_coliru_compile(code, data)
+            if result:
+                await ctx.safe_send(result)
+            else:
+                await ctx.send("no result")
+
+    async def cached_coliru_compile(self, code, data):
+        key = content_key(code.command, code.source)
+        if (result := self.results.get(key)) is not None:
+            return result
 
+        result, ok = await self.coliru_compile(self.bot.session, data)
+        if ok and not has_nocache_marker(code.source):
+            self.results.put(key, result, size=len(result) + len(code.source))
+        return result
 
     async def coliru_compile(self, session, data):
+        """return the output and whether it is a genuine result of the run"""
         async with session.post('http://coliru.stacked-crooked.com/compile', data=data) as resp:
             if resp.status != 200:
-                return 'Coliru did not respond in time.'
+                return 'Coliru did not respond in time.', False
 
             output = await resp.text(encoding='utf-8')
 
             if len(output) < 1992:
-                return output
+                return output, True
 
-            # output is too big so post it in gist
+            # output is too big so post it to our paste service, or share it on coliru
+            if (paste := self.bot.get_cog("Paste")) is not None:
+                return f'Output too big. Full output: {paste.upload(output)}', True
             return await self.coliru_shorten(session, data)
 
     @staticmethod
     async def coliru_shorten(session, data):
         async with session.post('http://coliru.stacked-crooked.com/share', data=data) as response:
             if response.status != 200:
-                return 'Could not create coliru shared link'
+                return 'Could not create coliru shared link', False
             else:
                 shared_id = await response.text()
                 link = f'http://coliru.stacked-crooked.com/a/{shared_id}'
-                return f'Output too big. Coliru link: {link}'
+                return f'Output too big. Coliru link: {link}', True
 
 
     @coliru.error
@@ -0,0 +1,157 @@
+import os
+import logging
+import importlib.util
+from datetime import datetime
+
+from discord.ext import tasks, commands
+from discord.ext.commands import has_permissions
+
+from .utils import scheduler
+
+log = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_BATCH_SIZE = 10_000
+EXPORT_COMPRESSION = "zstd"
+
+
+def month_start(date):
+    return datetime(date.year, date.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_between(from_date, to_date):
+    """the starts of the months from the month of from_date up to (excluding) the month of to_date"""
+    month = month_start(from_date)
+    while month < month_start(to_date):
+        yield month
+        month = next_month(month)
+
+
+def archived_until(processes):
+    """
+    the end of the archive without gaps, the finished weeks
+    of the logger up to the first week whose backfill failed
+    """
+    finished = [process.get("to_date") for process in processes if process.get("finished_at") is not None]
+    if not finished:
+        return None
+    failed = [process.get("from_date") for process in processes if process.get("finished_at") is None]
+    return min([max(finished), *failed])
+
+
+def arrow_schema(source):
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("us")
+    return {
+        "messages": pa.schema([("channel_id", pa.int64()), ("author_id", pa.int64()), ("id", pa.int64()),
+                               ("content", pa.string()), ("created_at", timestamp),
+                               ("edited_at", timestamp), ("deleted_at", timestamp)]),
+        "reactions": pa.schema([("message_id", pa.int64()), ("channel_id", pa.int64()), ("created_at", timestamp),
+                                ("name", pa.string()), ("member_ids", pa.list_(pa.int64()))]),
+        "emojis": pa.schema([("message_id", pa.int64()), ("channel_id", pa.int64()), ("author_id", pa.int64()),
+                             ("created_at", timestamp), ("name", pa.string()), ("count", pa.int32())]),
+    }[source]
+
+
+class ParquetPartitionWriter:
+    """
+    writes one month of one guild of a source into a hive partitioned
+    parquet file ({source}/guild_id={id}/month={YYYY-MM}/part-0.parquet),
+    the file only appears once it is complete
+    """
+
+    def __init__(self, root, source, guild_id, month):
+        self.schema = arrow_schema(source)
+        directory = os.path.join(root, source, f"guild_id={guild_id}", f"month={month:%Y-%m}")
+        self.path = os.path.join(directory, "part-0.parquet")
+        self.tmp_path = self.path + ".tmp"
+        self.writer = None
+        self.rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=EXPORT_COMPRESSION)
+        self.writer.write_table(pa.Table.from_batches([batch]))
+        self.rows += len(rows)
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class Export(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.export_all.start()
+
+    def cog_unload(self):
+        self.export_all.cancel()
+
+    @tasks.loop(hours=24)
+    async def export_all(self):
+        for guild in self.bot.guilds:
+            self.schedule(guild)
+
+    @export_all.before_loop
+    async def before_export_all(self):
+        await self.bot.wait_until_ready()
+
+    def schedule(self, guild, priority=scheduler.LOW):
+        if importlib.util.find_spec("pyarrow") is None:
+            log.warning("pyarrow is not installed, skipping the export of %s", guild)
+            return False
+
+        self.bot.scheduler.submit(f"export.{guild.id}", lambda: self.export_guild(guild), priority=priority)
+        return True
+
+    async def export_guild(self, guild):
+        """export the months since the watermark of every source the logger has finished"""
+        archived = archived_until(await self.bot.db.logger.select(guild.id))
+        if archived is None:
+            log.info("the messages of %s are not backed up yet, skipping the export", guild)
+            return
+
+        until = min(datetime.utcnow(), archived)
+        for source in self.bot.db.export.SOURCES:
+            since = await self.bot.db.export.get_watermark(guild.id, source) or guild.created_at
+            for month in months_between(since, until):
+                await self.export_month(guild, source, month)
+                await self.bot.db.export.set_watermark(guild.id, source, next_month(month))
+
+    async def export_month(self, guild, source, month):
+        writer = ParquetPartitionWriter(EXPORT_DIR, source, guild.id, month)
+        rows = self.bot.db.export.stream(source, guild.id, month, next_month(month), batch_size=EXPORT_BATCH_SIZE)
+        async for batch in rows:
+            await self.bot.loop.run_in_executor(None, writer.write, batch)
+        await self.bot.loop.run_in_executor(None, writer.close)
+
+        if writer.rows:
+            log.info("exported %d %s of %s for %s", writer.rows, source, guild, f"{month:%Y-%m}")
+
+    @commands.command(name="export")
+    @has_permissions(administrator=True)
+    async def _export(self, ctx):
+        """Export the archive of this guild to parquet files for analytics"""
+        if not self.schedule(ctx.guild, priority=scheduler.NORMAL):
+            await ctx.send_error("pyarrow is not installed, the export is not available")
+            return
+        await ctx.send_success(f"export scheduled, the files will appear in `{EXPORT_DIR}/`")
+
+
+def setup(bot):
+    bot.add_cog(Export(bot))
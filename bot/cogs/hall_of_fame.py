@@ -1,5 +1,4 @@
 import re
-from emoji import demojize
 
 from discord import Embed, Emoji, PartialEmoji
 from discord.ext import commands
@@ -54,6 +53,7 @@ class HoF(commands.Cog):
 
     @staticmethod
     def should_ignore(reaction):
+        from emoji import demojize
         channel = reaction.message.channel
         emoji_name = emoji.name if isinstance(emoji := reaction.emoji, Emoji) else demojize(emoji)
         msg_content = reaction.message.content
@@ -1,15 +1,70 @@
 import time
 from datetime import datetime
+from collections import Counter
 
 from discord import Embed, Color
 from discord.ext import commands
-from discord.utils import get
+
+INFO_EMOJIS = ("status_online", "status_idle", "status_dnd", "status_streaming", "status_offline",
+               "category_channel", "text_channel", "voice_channel")
 
 
 class Info(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+        self.status = {}
+        self.emojis = {}
+        self.build_emoji_map()
+
+    def build_emoji_map(self):
+        self.emojis = {}
+        for emoji in self.bot.emojis:
+            if emoji.name in INFO_EMOJIS:
+                self.emojis.setdefault(emoji.name, emoji)
+
+    def get_status(self, guild):
+        """
+        counts of the member statuses of the guild, counted once
+        and then kept up to date by the member events
+        """
+        if (status := self.status.get(guild.id)) is None:
+            status = self.status[guild.id] = Counter(member.status.name for member in guild.members)
+        return status
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # members may have changed while disconnected
+        self.status.clear()
+        self.build_emoji_map()
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, _guild, _before, _after):
+        self.build_emoji_map()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        if (status := self.status.get(member.guild.id)) is not None:
+            status[member.status.name] += 1
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        if (status := self.status.get(member.guild.id)) is not None:
+            status[member.status.name] -= 1
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.status is after.status:
+            return
+
+        if (status := self.status.get(after.guild.id)) is not None:
+            status[before.status.name] -= 1
+            status[after.status.name] += 1
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.status.pop(guild.id, None)
+
     @commands.command()
     async def uptime(self, ctx):
         running_for = datetime.now() - self.bot.uptime
@@ -44,19 +99,18 @@ class Info(commands.Cog):
         Total:
         """
 
-        status = {}
-        for member in ctx.guild.members:
-            status[member.status.name] = status.get(member.status.name, 0) + 1
+        await self.bot.ensure_chunked(ctx.guild)
+        status = self.get_status(ctx.guild)
 
-        online = get(self.bot.emojis, name="status_online")
-        idle = get(self.bot.emojis, name="status_idle")
-        dnd = get(self.bot.emojis, name="status_dnd")
-        streaming = get(self.bot.emojis, name="status_streaming")
-        offline = get(self.bot.emojis, name="status_offline")
+        online = self.emojis.get("status_online")
+        idle = self.emojis.get("status_idle")
+        dnd = self.emojis.get("status_dnd")
+        streaming = self.emojis.get("status_streaming")
+        offline = self.emojis.get("status_offline")
 
-        category = get(self.bot.emojis, name="category_channel")
-        text = get(self.bot.emojis, name="text_channel")
-        voice = get(self.bot.emojis, name="voice_channel")
+        category = self.emojis.get("category_channel")
+        text = self.emojis.get("text_channel")
+        voice = self.emojis.get("voice_channel")
 
         embed = Embed(
             title=f"{ctx.guild.name}",
@@ -78,7 +132,7 @@ class Info(commands.Cog):
             inline=False
         )
         embed.add_field(
-            name=f"Members ({len(ctx.guild.members)})",
+            name=f"Members ({ctx.guild.member_count})",
             value=("{online} {online_count} " +
                    "{idle} {idle_count} " +
                    "{dnd} {dnd_count} " +
@@ -92,6 +146,9 @@ class Info(commands.Cog):
                 offline=offline, offline_count=status.get("offline", 0)),
             inline=False
         )
+        if not self.bot.intents.presences:
+            embed.add_field(name="Note", value="presences are disabled (lean cache), every member is counted as offline",
+                            inline=False)
 
         author = ctx.message.author
         time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
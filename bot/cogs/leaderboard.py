@@ -1,26 +1,24 @@
-import re
 from typing import Union
 from datetime import datetime
-from emoji import demojize, emojize
 
 from discord import TextChannel, Member, Embed
 from discord.ext import commands
 from discord.utils import get, escape_markdown
 
+from .utils import emotes
 
-class Emote(commands.Converter):
-    REGEX = r"(?::\w+(?:~\d+)?:)"
 
+class Emote(commands.Converter):
     def __init__(self, name=None):
         self.name = name
 
     async def convert(self, ctx, argument):
-        emote = re.search(self.REGEX, demojize(argument))
+        emote = emotes.extractor().first(argument)
 
         if emote is None:
             raise commands.BadArgument(f"Emote {argument} not found")
 
-        self.name = emote.group().strip(":")
+        self.name = emote.strip(":")
         return self
 
     def __repr__(self):
@@ -67,6 +65,7 @@ class Leaderboard(commands.Cog):
         async with ctx.typing():
             member = member if member else ctx.author
             channel_id = channel.id if channel else None
+            await self.bot.ensure_chunked(ctx.guild)
             bot_ids = [bot.id for bot in filter(lambda user: user.bot, ctx.guild.members)]
 
             await self.bot.db.leaderboard.refresh()
@@ -139,6 +138,7 @@ class Leaderboard(commands.Cog):
         async with ctx.typing():
             member_id = member.id if member else None
             channel_id = channel.id if channel else None
+            await self.bot.ensure_chunked(ctx.guild)
             bot_ids = [bot.id for bot in filter(lambda user: user.bot, ctx.guild.members)]
             emoji = str(emoji) if emoji else None
 
@@ -148,6 +148,8 @@ class Leaderboard(commands.Cog):
             await self.display_emojiboard(ctx, data)
 
     async def display_emojiboard(self, ctx, data):
+        from emoji import emojize
+
         def get_value(row):
             discord_emoji = get(self.bot.emojis, name=row["name"].strip(":"))
             demojized_emoji = emojize(row["name"])
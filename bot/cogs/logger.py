@@ -1,6 +1,5 @@
 import asyncio
 import logging
-from collections import deque
 from datetime import datetime, timedelta
 
 from discord import Member, TextChannel, CategoryChannel
@@ -9,8 +8,12 @@ from discord.ext import tasks, commands
 from discord.ext.commands import has_permissions
 from discord.errors import Forbidden, NotFound
 
+from .utils import scheduler, ingest
+
 log = logging.getLogger(__name__)
 
+HISTORY_PAGE_SIZE = 100  # messages fetched by one REST call
+
 def partition(cond, lst):
     return [[i for i in lst if cond(i)], [i for i in lst if not cond(i)]]
 
@@ -19,11 +22,13 @@ class BackupUntilPresent:
     def __init__(self, bot):
         self.bot = bot
 
-    async def backup(self):
-        log.info("Starting backup process")
-        await self.backup_guilds()
+    async def backup(self, shard_id=None):
+        """back up the guilds of the shard, or of all shards when shard_id is None"""
+        guilds = self.bot.shard_guilds(shard_id)
+        log.info("Starting backup process (shard %s)", "all" if shard_id is None else shard_id)
+        await self.backup_guilds(guilds)
 
-        for guild in self.bot.guilds:
+        for guild in guilds:
             await self.backup_categories(guild)
             await self.backup_roles(guild)
             await self.backup_members(guild)
@@ -32,32 +37,33 @@ class BackupUntilPresent:
 
         log.info("Finished backup process")
 
-    async def backup_guilds(self):
+    async def backup_guilds(self, guilds):
         log.info("backing up guilds")
-        data = await self.bot.db.guilds.prepare(self.bot.guilds)
-        await self.bot.db.guilds.insert(data)
+        data = await self.bot.db.guilds.prepare(guilds)
+        await self.bot.ingest.write("guilds.insert", data)
 
     async def backup_categories(self, guild):
         log.info("backing up categories")
         data = await self.bot.db.categories.prepare(guild.categories)
-        await self.bot.db.categories.insert(data)
+        await self.bot.ingest.write("categories.insert", data)
 
     async def backup_roles(self, guild):
         log.info("backing up roles")
         data = await self.bot.db.roles.prepare(guild.roles)
-        await self.bot.db.roles.insert(data)
+        await self.bot.ingest.write("roles.insert", data)
 
     async def backup_members(self, guild):
         log.info("backing up members")
+        await self.bot.ensure_chunked(guild)
         for i in range(0, len(guild.members), 550):
             chunk = guild.members[i:i+550]
             data = await self.bot.db.members.prepare(chunk)
-            await self.bot.db.members.insert(data)
+            await self.bot.ingest.write("members.insert", data)
 
     async def backup_channels(self, guild):
         log.info("backing up channels")
         data = await self.bot.db.channels.prepare(guild.text_channels)
-        await self.bot.db.channels.insert(data)
+        await self.bot.ingest.write("channels.insert", data)
 
     async def backup_messages(self, guild):
         log.info("backing up messages")
@@ -91,6 +97,7 @@ class BackupUntilPresent:
             await self.try_to_backup_messages_in_nonempty_channel(channel, from_date, to_date)
 
         await self.bot.db.logger.mark_process_finished(guild.id, from_date, to_date, is_first_week=False)
+        await self.bot.db.activity.rollup(from_date, to_date)
 
     async def backup_new_week(self, guild):
         finished_process = await self.get_finished_process(guild)
@@ -104,6 +111,8 @@ class BackupUntilPresent:
 
         is_first_week = finished_process is None
         await self.bot.db.logger.mark_process_finished(guild.id, from_date, to_date, is_first_week)
+        # the backfilled week is older than the hourly rollup looks back
+        await self.bot.db.activity.rollup(from_date, to_date)
         return self.next_week_still_behind_today(to_date)
 
     async def get_finished_process(self, guild):
@@ -139,69 +148,38 @@ class BackupUntilPresent:
         to_date_str = to_date.strftime('%d.%m.%Y')
         log.info("backing up messages {%s} - {%s} in %s (%s)", from_date_str, to_date_str, channel, channel.guild)
 
-        collectables = self.get_collectables()
+        fetched = 0
         async for message in channel.history(after=from_date, before=to_date, limit=1_000_000, oldest_first=True):
-            for collectable in collectables:
-                await collectable.add(message)
+            if fetched % HISTORY_PAGE_SIZE == 0:
+                await self.bot.scheduler.throttle()
+            fetched += 1
 
-        else:
-            for collectable in collectables:
-                await collectable.db_insert()
-
-    def get_collectables(self):
-        return [
-            Collectable(
-                prepare_fn=self.bot.db.members.prepare_from_message,
-                insert_fn=self.bot.db.members.insert
-            ),
-            Collectable(
-                prepare_fn=self.bot.db.messages.prepare,
-                insert_fn=self.bot.db.messages.insert
-            ),
-            Collectable(
-                prepare_fn=self.bot.db.attachments.prepare,
-                insert_fn=self.bot.db.attachments.insert
-            ),
-            Collectable(
-                prepare_fn=self.bot.db.reactions.prepare,
-                insert_fn=self.bot.db.reactions.insert
-            ),
-            Collectable(
-                prepare_fn=self.bot.db.emojis.prepare,
-                insert_fn=self.bot.db.emojis.insert
-            )
-        ]
+            await self.bot.ingest.send("backfill", await ingest.snapshot(message, with_reactions=True))
+
+        # the week is marked as finished only once its messages are written
+        await self.bot.ingest.flush()
 
 
 class BackupOnEvents:
     def __init__(self, bot):
         self.bot = bot
 
-        self.insert_queues = {}
-        self.update_queues = {}
-        self.delete_queues = {}
-
-        self.task_put_queues_to_database.start()
-
-    def cog_unload(self):
-        self.task_put_queues_to_database.cancel()
-
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
         log.info("joined guild %s", guild)
         data = await self.bot.db.guilds.prepare_one(guild)
-        await self.bot.db.guilds.insert([data])
+        await self.bot.ingest.write("guilds.insert", [data])
 
     @commands.Cog.listener()
     async def on_guild_update(self, before, after):
         log.info("updated guild from %s to %s", before, after)
         data = await self.bot.db.guilds.prepare_one(after)
-        await self.bot.db.guilds.insert([data])
+        await self.bot.ingest.write("guilds.insert", [data])
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         log.info("left guild %s", guild)
-        await self.bot.db.guilds.soft_delete([(guild.id,)])
+        await self.bot.ingest.write("guilds.soft_delete", [(guild.id,)])
 
     @commands.Cog.listener()
     async def on_guild_channel_create(self, channel):
@@ -215,11 +193,11 @@ class BackupOnEvents:
 
     async def on_textchannel_create(self, channel):
         data = await self.bot.db.channels.prepare_one(channel)
-        await self.bot.db.channels.insert([data])
+        await self.bot.ingest.write("channels.insert", [data])
 
     async def on_category_create(self, channel):
         data = await self.bot.db.categories.prepare_one(channel)
-        await self.bot.db.categories.insert([data])
+        await self.bot.ingest.write("categories.insert", [data])
 
     @commands.Cog.listener()
     async def on_guild_channel_update(self, before, after):
@@ -233,21 +211,21 @@ class BackupOnEvents:
 
     async def on_textchannel_update(self, _before, after):
         data = await self.bot.db.channels.prepare_one(after)
-        await self.bot.db.channels.update([data])
+        await self.bot.ingest.write("channels.update", [data])
 
     async def on_category_update(self, _before, after):
         data = await self.bot.db.categories.prepare_one(after)
-        await self.bot.db.categories.update([data])
+        await self.bot.ingest.write("categories.update", [data])
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel):
         log.info("deleted channel %s (%s)", channel, channel.guild)
 
         if isinstance(channel, TextChannel):
-            await self.bot.db.channels.soft_delete([(channel.id,)])
+            await self.bot.ingest.write("channels.soft_delete", [(channel.id,)])
 
         elif isinstance(channel, CategoryChannel):
-            await self.bot.db.categories.soft_delete([(channel.id,)])
+            await self.bot.ingest.write("categories.soft_delete", [(channel.id,)])
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -257,33 +235,28 @@ class BackupOnEvents:
         if not isinstance(message.author, Member):
             return
 
-        data = await self.bot.db.messages.prepare_one(message)
-        self.insert_queues.setdefault(self.bot.db.messages.insert, deque())
-        self.insert_queues[self.bot.db.messages.insert].append(data)
+        await self.bot.ingest.send("message", await ingest.snapshot(message))
 
     @commands.Cog.listener()
     async def on_message_edit(self, before, after):
         if isinstance(before.channel, PrivateChannel):
             return
 
-        data = await self.bot.db.messages.prepare_one(after)
-        self.update_queues.setdefault(self.bot.db.messages.insert, deque())
-        self.update_queues[self.bot.db.messages.insert].append(data)
+        await self.bot.ingest.send("edit", await ingest.snapshot(after))
 
     @commands.Cog.listener()
     async def on_message_delete(self, message):
         if isinstance(message.channel, PrivateChannel):
             return
 
-        self.delete_queues.setdefault(self.bot.db.messages.soft_delete, deque())
-        self.delete_queues[self.bot.db.messages.soft_delete].append((message.id,))
+        await self.bot.ingest.send("delete", (message.id, message.created_at))
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
         log.info("member %s joined (%s)", member, member.guild)
 
         data = await self.bot.db.members.prepare_one(member)
-        await self.bot.db.members.insert([data])
+        await self.bot.ingest.write("members.insert", [data])
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
@@ -297,55 +270,33 @@ class BackupOnEvents:
             return
 
         data = await self.bot.db.members.prepare_one(after)
-        self.update_queues.setdefault(self.bot.db.members.insert, deque())
-        self.update_queues[self.bot.db.members.insert].append(data)
+        await self.bot.ingest.write("members.insert", [data])
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
         log.info("member %s left (%s)", member, member.guild)
 
-        await self.bot.db.members.soft_delete([(member.id,)])
+        await self.bot.ingest.write("members.soft_delete", [(member.id,)])
 
     @commands.Cog.listener()
     async def on_guild_role_create(self, role):
         log.info("added role %s (%s)", role, role.guild)
 
         data = await self.bot.db.roles.prepare_one(role)
-        await self.bot.db.roles.insert([data])
+        await self.bot.ingest.write("roles.insert", [data])
 
     @commands.Cog.listener()
     async def on_guild_role_update(self, before, after):
         log.info("updated role from %s to %s (%s)", before, after, before.guild)
 
         data = await self.bot.db.roles.prepare_one(after)
-        await self.bot.db.roles.insert([data])
+        await self.bot.ingest.write("roles.insert", [data])
 
     @commands.Cog.listener()
     async def on_guild_role_remove(self, role):
         log.info("removed role %s (%s)", role, role.guild)
 
-        await self.bot.db.roles.soft_delete([(role.id,)])
-
-    @tasks.loop(minutes=5)
-    async def task_put_queues_to_database(self):
-        try:
-            await self.put_queues_to_database(self.insert_queues, limit=1000)
-            await self.put_queues_to_database(self.update_queues, limit=2000)
-            await self.put_queues_to_database(self.delete_queues, limit=1000)
-        except Exception:
-            pass
-
-    async def put_queues_to_database(self, queues, *, limit=1000):
-        counter = 0
-
-        for (process_fn, queue) in queues.items():
-            take_elements = min(limit - counter, len(queue))
-            if take_elements == 0:
-                return
-            log.info("Putting %s from queue to database", take_elements)
-            elements = [queue.popleft() for _ in range(take_elements)]
-            await process_fn(elements)
-            counter += take_elements
+        await self.bot.ingest.write("roles.soft_delete", [(role.id,)])
 
 
 class Logger(commands.Cog, BackupUntilPresent, BackupOnEvents):
@@ -355,33 +306,43 @@ class Logger(commands.Cog, BackupUntilPresent, BackupOnEvents):
         BackupUntilPresent.__init__(self, bot)
         BackupOnEvents.__init__(self, bot)
 
+    def schedule_backup(self, shard_id, priority=scheduler.LOW):
+        """
+        one job per shard, so the backups started by the shards,
+        the weekly loop and !backup dedupe by the job name
+        """
+        self.bot.scheduler.submit(f"logger.backup.{shard_id}", lambda: self.backup(shard_id), priority=priority)
+
+    def schedule_backups(self, priority=scheduler.LOW):
+        for shard_id in sorted(self.bot.shards):
+            self.schedule_backup(shard_id, priority)
+
     @commands.Cog.listener()
-    async def on_ready(self):
-        await self.backup()
+    async def on_shard_ready(self, shard_id):
+        self.schedule_backup(shard_id)
 
     @tasks.loop(hours=168)  # 168 hours == 1 week
     async def _repeat_backup(self):
-        await self.backup()
+        self.schedule_backups()
 
     @commands.command(name="backup")
     @has_permissions(administrator=True)
-    async def _backup(self, _ctx):
-        await self.backup()
-
-
-class Collectable:
-    def __init__(self, prepare_fn=None, insert_fn=None):
-        self.content = []
-        self.prepare_fn = prepare_fn
-        self.insert_fn = insert_fn
-
-    async def add(self, item):
-        self.content.extend(await self.prepare_fn(item))
-
-    async def db_insert(self):
-        for i in range(0, len(self.content), 550):
-            batch = self.content[i:i+550]
-            await self.insert_fn(batch)
+    async def _backup(self, ctx):
+        # the backup throttles itself while commands run, so it cannot run inside this one
+        self.schedule_backups(priority=scheduler.HIGH)
+        await ctx.send_success("backup scheduled")
+
+    @commands.command(name="archive")
+    @commands.is_owner()
+    async def _archive(self, ctx, months: int = 24):
+        """Detach the message partitions older than the given number of months"""
+        older_than = datetime.now() - timedelta(days=months * 31)
+        detached = await self.bot.db.messages.detach_partitions(older_than)
+        if not detached:
+            await ctx.send_embed("there are no partitions to detach")
+            return
+        await ctx.send_success("detached " + ", ".join(f"`server.{name}`" for name in detached) +
+                               ", dump them with pg_dump and drop them to free the space")
 
 
 def setup(bot):
@@ -0,0 +1,131 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+
+from aiohttp import web
+from discord.ext import commands
+
+log = logging.getLogger(__name__)
+
+PASTE_DIR = os.getenv("PASTE_DIR", "pastes")
+# local only by default, expose it through a reverse proxy or set PASTE_HOST=0.0.0.0
+PASTE_HOST = os.getenv("PASTE_HOST", "127.0.0.1")
+PASTE_PORT = int(os.getenv("PASTE_PORT", "8070"))
+PASTE_URL = os.getenv("PASTE_URL", f"http://localhost:{PASTE_PORT}").rstrip("/")
+
+KEY_REGEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasteStore:
+    """
+    content-addressed blob store on disk, every paste is saved
+    gzipped under the sha256 of its content, so identical
+    content is stored only once
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def key(content):
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.gz")
+
+    def write(self, key, content):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb") as file:
+            file.write(content.encode())
+        os.replace(tmp_path, path)
+
+    def read(self, key):
+        """return the gzipped content or None if there is no such paste"""
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+
+class Paste(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.store = PasteStore(PASTE_DIR)
+        self.pending = {}
+        self.stored = set()
+        self.runner = None
+
+        self.bot.loop.create_task(self.start_server())
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get("/{key}", self.handle_get)
+        return app
+
+    async def start_server(self):
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, PASTE_HOST, PASTE_PORT).start()
+        except OSError:
+            log.exception("failed to start the paste server on %s:%d, the pastes will not be served",
+                          PASTE_HOST, PASTE_PORT)
+            await runner.cleanup()
+            return
+
+        self.runner = runner
+        log.info("paste server listening on %s:%d", PASTE_HOST, PASTE_PORT)
+
+    def upload(self, content):
+        """
+        Return the url of the content right away and write it
+        to the store in the background, skipping content already stored.
+        """
+        key = self.store.key(content)
+        if key not in self.stored and key not in self.pending:
+            future = self.bot.loop.run_in_executor(None, self.store.write, key, content)
+            future.add_done_callback(lambda future: self.on_written(key, future))
+            self.pending[key] = future
+        return f"{PASTE_URL}/{key}"
+
+    def on_written(self, key, future):
+        del self.pending[key]
+        if future.exception() is not None:
+            log.error("failed to store paste %s", key, exc_info=future.exception())
+            return
+        self.stored.add(key)
+
+    async def handle_get(self, request):
+        key = request.match_info["key"]
+        if not KEY_REGEX.match(key):
+            raise web.HTTPNotFound()
+
+        if (pending := self.pending.get(key)) is not None:
+            await pending
+
+        data = await self.bot.loop.run_in_executor(None, self.store.read, key)
+        if data is None:
+            raise web.HTTPNotFound()
+
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            return web.Response(body=data,
+                                headers={"Content-Encoding": "gzip"},
+                                content_type="text/plain", charset="utf-8")
+
+        return web.Response(body=gzip.decompress(data), content_type="text/plain", charset="utf-8")
+
+
+def setup(bot):
+    bot.add_cog(Paste(bot))
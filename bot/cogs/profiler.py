@@ -0,0 +1,159 @@
+import io
+import os
+import sys
+import inspect
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import discord
+from discord.ext import commands
+
+from .utils import scheduler
+
+log = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 300
+TRACEMALLOC_FRAMES = 25
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop thread from a background thread.
+
+    Every sample is recorded as a collapsed stack (flamegraph.pl format)
+    and attributed to the outermost coroutine on the stack, which is
+    the task that was holding the event loop at that moment.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.coroutines = Counter()
+        self.samples = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if (frame := sys._current_frames().get(self.thread_id)) is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        stack = []
+        coroutine = "<idle>"
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            if code.co_flags & inspect.CO_COROUTINE:
+                coroutine = code.co_qualname if hasattr(code, "co_qualname") else code.co_name
+            frame = frame.f_back
+
+        self.stacks[";".join(reversed(stack))] += 1
+        self.coroutines[coroutine] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profiler(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.profiler = None
+        self.memory_baseline = None
+
+    async def cog_check(self, ctx):
+        return await self.bot.is_owner(ctx.author)
+
+    def cog_unload(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @commands.group(name="profile", invoke_without_command=True)
+    async def profile(self, ctx):
+        await ctx.send_help(ctx.command)
+
+    @profile.command(name="cpu")
+    @scheduler.not_interactive
+    async def profile_cpu(self, ctx, seconds: int = 30):
+        """
+        Sample the event loop for N seconds, send collapsed stacks and the top coroutines
+
+        the background jobs keep running meanwhile, the profile shows the bot as it normally runs
+        """
+        if self.profiler is not None:
+            await ctx.send_error("a profiler is already running")
+            return
+
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        log.info("profiling the event loop for %d seconds", seconds)
+        await ctx.send_embed(f"profiling for {seconds} seconds...", delete_after=seconds)
+
+        self.profiler = profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+            self.profiler = None
+
+        interval_ms = profiler.interval * 1000
+        top = "\n".join(f"`{count * interval_ms:>8.0f}ms` {name}"
+                        for name, count in profiler.coroutines.most_common(10))
+
+        filename = f"profile_{datetime.now():%Y%m%d_%H%M%S}.folded"
+        data = io.BytesIO(profiler.collapsed().encode())
+        await ctx.send_embed(top or "no samples", name=f"Top coroutines by wall time ({profiler.samples} samples)")
+        await ctx.send(file=discord.File(data, filename=filename))
+
+    @profile.group(name="memory", invoke_without_command=True)
+    async def profile_memory(self, ctx):
+        """Start tracing allocations and take a baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+        self.memory_baseline = await self.bot.loop.run_in_executor(None, tracemalloc.take_snapshot)
+        await ctx.send_success("memory baseline taken, use `!profile memory diff` later to compare")
+
+    @profile_memory.command(name="diff")
+    async def profile_memory_diff(self, ctx, limit: int = 10):
+        """Compare the current allocations with the baseline snapshot"""
+        if self.memory_baseline is None:
+            await ctx.send_error("take a baseline first with `!profile memory`")
+            return
+
+        def compare():
+            snapshot = tracemalloc.take_snapshot()
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            return snapshot.compare_to(self.memory_baseline, "lineno")
+
+        differences = await self.bot.loop.run_in_executor(None, compare)
+        lines = [str(stat) for stat in differences[:limit]]
+        await ctx.safe_send("```\n" + "\n".join(lines) + "\n```", escape_mentions=False)
+
+    @profile_memory.command(name="stop")
+    async def profile_memory_stop(self, ctx):
+        """Stop tracing allocations"""
+        tracemalloc.stop()
+        self.memory_baseline = None
+        await ctx.send_success("memory tracing stopped")
+
+
+def setup(bot):
+    bot.add_cog(Profiler(bot))
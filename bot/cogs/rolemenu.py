@@ -7,7 +7,8 @@ from discord.ext import commands
 from discord.utils import get, find
 from discord.errors import HTTPException, Forbidden
 
-from .utils import constants
+from .utils import constants, scheduler
+from .utils.router import route
 
 
 log = logging.getLogger(__name__)
@@ -42,18 +43,15 @@ class Rolemenu(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
+    @route("raw_reaction_add", channels=constants.about_you_channels)
     async def on_raw_reaction_add(self, payload):
         await self.on_raw_reaction_update(payload)
 
-    @commands.Cog.listener()
+    @route("raw_reaction_remove", channels=constants.about_you_channels)
     async def on_raw_reaction_remove(self, payload):
         await self.on_raw_reaction_update(payload)
 
     async def on_raw_reaction_update(self, payload):
-        if payload.channel_id not in constants.about_you_channels:
-            return
-
         guild = self.bot.get_guild(payload.guild_id)
         channel = get(guild.text_channels, id=payload.channel_id)
         message = await channel.fetch_message(payload.message_id)
@@ -102,11 +100,8 @@ class Rolemenu(commands.Cog):
             log.info("hidden channel %s from %s", str(channel), author)
             return
 
-    @commands.Cog.listener()
+    @route("message", channels=constants.about_you_channels)
     async def on_message(self, message):
-        if message.channel.id not in constants.about_you_channels:
-            return
-
         for row in message.content.split("\n"):
             emoji = row.strip().split(" ", 1)[0]
             try:
@@ -135,11 +130,8 @@ class Rolemenu(commands.Cog):
         emoji_id = re.match(r"<:.*:(\d+)>", string).group(1)
         return get(self.bot.emojis, id=int(emoji_id))
 
-    @commands.Cog.listener()
+    @route("raw_message_edit", channels=constants.about_you_channels)
     async def on_raw_message_edit(self, payload):
-        if payload.channel_id not in constants.about_you_channels:
-            return
-
         channel = self.bot.get_channel(payload.channel_id)
         message = await channel.fetch_message(payload.message_id)
 
@@ -158,16 +150,22 @@ class Rolemenu(commands.Cog):
 
 
     @commands.Cog.listener()
-    async def on_ready(self):
+    async def on_shard_ready(self, shard_id):
+        self.bot.scheduler.submit(f"rolemenu.balance.{shard_id}", lambda: self.balance_menus(shard_id),
+                                  priority=scheduler.NORMAL)
+
+    async def balance_menus(self, shard_id=None):
+        guilds = self.bot.shard_guilds(shard_id)
         for channel_id in constants.about_you_channels:
             channel = self.bot.get_channel(channel_id)
-            if channel is None:
+            if channel is None or channel.guild not in guilds:
                 continue
 
             async for message in channel.history():
                 if not message.reactions:
                     continue
 
+                await self.bot.scheduler.throttle()
                 await self.parse_and_balance(channel, message)
 
     async def parse_and_balance(self, channel, message):
@@ -210,6 +208,7 @@ class Rolemenu(commands.Cog):
                 log.info("added role %s to %s", str(role), user)
                 await user.add_roles(role)
 
+        await self.bot.ensure_chunked(message.guild)
         for user in role.members:
             has_reacted = await reaction.users().get(id=user.id)
             if not has_reacted:
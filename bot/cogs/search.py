@@ -0,0 +1,113 @@
+import re
+from datetime import datetime
+
+from discord import Color
+from discord.ext import commands
+from discord.utils import escape_markdown
+
+from .utils import paginator
+
+DATE_FILTER_REGEX = r"\b(after|before):(\d{4}-\d{2}-\d{2})\b"
+CHANNEL_MENTION_REGEX = r"<#(\d+)>"
+MEMBER_MENTION_REGEX = r"<@!?(\d+)>"
+
+PER_PAGE = 10
+SNIPPET_LENGTH = 120
+
+
+class Search(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @staticmethod
+    def parse_date_filters(query):
+        """split after:YYYY-MM-DD and before:YYYY-MM-DD out of the query"""
+        filters = {"after": None, "before": None}
+        for name, date in re.findall(DATE_FILTER_REGEX, query):
+            try:
+                filters[name] = datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                raise commands.BadArgument(f"{date} is not a valid date, use YYYY-MM-DD")
+
+        query = re.sub(DATE_FILTER_REGEX, "", query).strip()
+        return query, filters["after"], filters["before"]
+
+    @staticmethod
+    def parse_mention_filters(guild, query):
+        """
+        split the #channel and @author mentions out of the query, only mentions
+        are filters so that a word of the query is never taken for a name
+        """
+        channel = author = None
+        if match := re.search(CHANNEL_MENTION_REGEX, query):
+            if (channel := guild.get_channel(int(match.group(1)))) is None:
+                raise commands.BadArgument("channel not found")
+        if match := re.search(MEMBER_MENTION_REGEX, query):
+            if (author := guild.get_member(int(match.group(1)))) is None:
+                raise commands.BadArgument("member not found")
+
+        query = re.sub(MEMBER_MENTION_REGEX, "", re.sub(CHANNEL_MENTION_REGEX, "", query)).strip()
+        return query, channel, author
+
+    @staticmethod
+    def readable_channel_ids(guild, member, channel=None):
+        """the channels the member can read, the search never looks outside of them"""
+        channels = [channel] if channel is not None else guild.text_channels
+        return [channel.id for channel in channels if channel.permissions_for(member).read_messages]
+
+    def format_entry(self, guild, row):
+        channel = guild.get_channel(row["channel_id"])
+        author = guild.get_member(row["author_id"])
+        content = row["content"].replace("\n", " ")
+        if len(content) > SNIPPET_LENGTH:
+            content = content[:SNIPPET_LENGTH - 3] + "..."
+
+        url = f"https://discord.com/channels/{guild.id}/{row['channel_id']}/{row['id']}"
+        return (f"[{row['created_at']:%Y-%m-%d}]({url}) " +
+                f"{channel.mention if channel else '#deleted-channel'} " +
+                f"**{escape_markdown(author.display_name if author else str(row['author_id']))}**: " +
+                escape_markdown(content))
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.cooldown(rate=2, per=10.0, type=commands.BucketType.user)
+    async def search(self, ctx, *, query):
+        """
+        Search the archived messages of the channels you can read
+
+        !search [#channel] [@author] [after:YYYY-MM-DD] [before:YYYY-MM-DD] words
+        the words support "quoted phrases", or and -excluded words
+        """
+        query, after, before = self.parse_date_filters(query)
+        query, channel, author = self.parse_mention_filters(ctx.guild, query)
+        if not query:
+            raise commands.BadArgument("nothing to search for")
+
+        channel_ids = self.readable_channel_ids(ctx.guild, ctx.author, channel)
+        if not channel_ids:
+            raise commands.BadArgument(f"you cannot read {channel.mention}" if channel else
+                                       "there are no channels you can read")
+
+        async def fetch(last, limit):
+            return await self.bot.db.messages.search(
+                ctx.guild.id, query, channel_ids,
+                author_id=author.id if author else None,
+                after=after, before=before, last=last, limit=limit)
+
+        rows = await fetch(None, PER_PAGE + 1)
+        if not rows:
+            await ctx.send_embed("no messages found", name="Search")
+            return
+
+        try:
+            pages = paginator.KeysetPages(ctx, fetch=fetch, first_rows=rows, per_page=PER_PAGE,
+                                          format_entry=lambda row: self.format_entry(ctx.guild, row),
+                                          template="{entry}", title=f"Search: {query}")
+            pages.embed.color = Color.blurple()
+            await pages.paginate()
+        except paginator.CannotPaginate as err:
+            await ctx.send_error(str(err))
+
+
+def setup(bot):
+    bot.add_cog(Search(bot))
@@ -3,18 +3,23 @@ from discord.ext import commands
 
 import os
 import re
+import time
 import asyncio
-import aiohttp
 import textwrap
 import logging
 import contextlib
 from signal import Signals
 from functools import partial
 from datetime import datetime
+from collections import OrderedDict, deque
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from .utils.cache import LRUCache, content_key, has_nocache_marker
+from .utils import metrics
+from .utils.metrics import Histogram
+
 log = logging.getLogger(__name__)
 
 ESCAPE_REGEX = re.compile("[`\u202E\u200B]{3,}")
@@ -39,19 +44,162 @@ RAW_CODE_REGEX = re.compile(
 SIGKILL = 9
 REEVAL_EMOJI = '\U0001f501'  # :repeat:
 
+MAX_CONCURRENT_JOBS = 3
+MAX_QUEUED_JOBS = 30
+QUEUE_TIMEOUT = 120
+JOB_TIMEOUT = 30
+
+RESULT_CACHE_BYTES = 4 * 1024 * 1024
+RESULT_CACHE_TTL = 60 * 60
+
+
+class EvalQueueFull(Exception):
+    pass
+
+
+class EvalScheduler:
+    """
+    Limit the number of eval jobs sent to the snekbox backend at once.
+
+    Jobs over the concurrency cap wait in a bounded queue, which is served
+    round-robin per user, so that one user cannot starve the others.
+    Records how long the jobs waited in the queue and how long they ran.
+    """
+
+    def __init__(self, concurrency=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS,
+                 queue_timeout=QUEUE_TIMEOUT, job_timeout=JOB_TIMEOUT):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.job_timeout = job_timeout
+
+        self.running = 0
+        self.waiting = 0
+        self.queues = OrderedDict()
+
+        self.wait_latency = Histogram()
+        self.run_latency = Histogram()
+
+    def position(self, user_id, waiter):
+        """1-based position of the waiter in the round-robin order"""
+        users = list(self.queues.keys())
+        nth = self.queues[user_id].index(waiter)
+        before = users[:users.index(user_id)]
+
+        position = 1
+        for other_id, queue in self.queues.items():
+            if other_id == user_id:
+                position += nth
+            elif other_id in before:
+                position += min(len(queue), nth + 1)
+            else:
+                position += min(len(queue), nth)
+        return position
+
+    async def run(self, user_id, job, on_queued=None):
+        """
+        Run the coroutine function job once there is a free slot.
+        on_queued is awaited with the queue position if the job has to wait.
+        """
+        queued_at = time.perf_counter()
+
+        if self.running < self.concurrency and not self.waiting:
+            self.running += 1
+        else:
+            await self.wait_for_slot(user_id, on_queued)
+
+        self.wait_latency.observe(time.perf_counter() - queued_at)
+
+        try:
+            with self.run_latency.time():
+                return await asyncio.wait_for(job(), timeout=self.job_timeout)
+        finally:
+            self.release()
+
+    async def wait_for_slot(self, user_id, on_queued):
+        if self.waiting >= self.max_queued:
+            raise EvalQueueFull()
+
+        waiter = asyncio.get_event_loop().create_future()
+        self.queues.setdefault(user_id, deque()).append(waiter)
+        self.waiting += 1
+
+        try:
+            if on_queued is not None:
+                await on_queued(self.position(user_id, waiter))
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+
+        except BaseException:
+            # timed out, cancelled or on_queued failed (e.g. the channel is gone)
+            if waiter.done() and not waiter.cancelled():
+                # the slot was already handed over to us, pass it on
+                self.release()
+            else:
+                self.discard(user_id, waiter)
+            raise
+
+    def discard(self, user_id, waiter):
+        queue = self.queues.get(user_id)
+        if queue is None or waiter not in queue:
+            return
+
+        queue.remove(waiter)
+        self.waiting -= 1
+        if not queue:
+            del self.queues[user_id]
+
+    def release(self):
+        """hand the slot over to the next waiting user, or free it"""
+        while self.queues:
+            user_id, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            self.waiting -= 1
+
+            del self.queues[user_id]
+            if queue:
+                self.queues[user_id] = queue
+
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.running -= 1
+
 
 class Snekbox(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.jobs = {}
+        self.scheduler = EvalScheduler()
+        self.results = LRUCache(max_bytes=RESULT_CACHE_BYTES, ttl=RESULT_CACHE_TTL)
+
+        metrics.REGISTRY.add_histogram("eval_wait_seconds", self.scheduler.wait_latency, "eval job queue wait")
+        metrics.REGISTRY.add_histogram("eval_run_seconds", self.scheduler.run_latency, "eval job run time")
+        metrics.REGISTRY.gauge("eval_queue_length", lambda: self.scheduler.waiting, "eval jobs waiting in the queue")
 
     async def post_eval(self, code: str) -> dict:
         """Send a POST request to the Snekbox API to evaluate code and return the results."""
         url = os.getenv("SNEKBOX")
         data = {"input": code}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, raise_for_status=True) as resp:
-                return await resp.json()
+        async with self.bot.session.post(url, json=data, raise_for_status=True) as resp:
+            return await resp.json()
+
+    async def cached_post_eval(self, code: str, *, schedule) -> dict:
+        """
+        Return the cached results of an identical snippet, or evaluate it.
+        Failed or timed out jobs and snippets with a `# nocache` marker are never cached.
+        """
+        key = content_key("python", code)
+        if (results := self.results.get(key)) is not None:
+            log.info("Eval results served from cache")
+            return results
+
+        results = await schedule(partial(self.post_eval, code))
+
+        returncode = results["returncode"]
+        if returncode is not None and returncode not in (255, 128 + SIGKILL) and not has_nocache_marker(code):
+            self.results.put(key, results, size=len(results["stdout"]) + len(code))
+        return results
 
     @staticmethod
     def prepare_input(code: str) -> str:
@@ -108,6 +256,8 @@ class Snekbox(commands.Cog):
         log.info("Formatting output...")
 
         output = output.rstrip("\n")
+        original_output = output  # To be uploaded to a pasting service if needed
+        paste_link = None
 
         if "<@" in output:
             output = output.replace("<@", "<@\u200B")  # Zero-width space
@@ -116,8 +266,9 @@ class Snekbox(commands.Cog):
             output = output.replace("<!@", "<!@\u200B")  # Zero-width space
 
         if ESCAPE_REGEX.findall(output):
-            return "Code block escape attempt detected; will not output result"
+            return "Code block escape attempt detected; will not output result", paste_link
 
+        truncated = False
         lines = output.count("\n")
 
         if lines > 0:
@@ -126,16 +277,21 @@ class Snekbox(commands.Cog):
             output = "\n".join(output)
 
         if lines > 10:
+            truncated = True
             if len(output) >= 1000:
                 output = f"{output[:1000]}\n... (truncated - too long, too many lines)"
             else:
                 output = f"{output}\n... (truncated - too many lines)"
         elif len(output) >= 1000:
+            truncated = True
             output = f"{output[:1000]}\n... (truncated - too long)"
 
+        if truncated and (paste := self.bot.get_cog("Paste")) is not None:
+            paste_link = paste.upload(original_output)
+
         output = output or "[No output]"
 
-        return output
+        return output, paste_link
 
     @staticmethod
     def get_status_emoji(results):
@@ -152,17 +308,30 @@ class Snekbox(commands.Cog):
         Evaluate code, format it, and send the output to the corresponding channel.
         Return the bot response.
         """
+        async def on_queued(position):
+            await ctx.send(f"{ctx.author.mention} :hourglass: Your eval job is queued at position {position}",
+                           delete_after=10)
+
         async with ctx.typing():
-            results = await self.post_eval(code)
+            try:
+                schedule = partial(self.scheduler.run, ctx.author.id, on_queued=on_queued)
+                results = await self.cached_post_eval(code, schedule=schedule)
+            except EvalQueueFull:
+                return await ctx.send(f"{ctx.author.mention} The eval queue is full, please try again later")
+            except asyncio.TimeoutError:
+                return await ctx.send(f"{ctx.author.mention} Your eval job timed out while waiting for the sandbox")
+
             msg, error = self.get_results_message(results)
 
             if error:
-                output = error
+                output, paste_link = error, None
             else:
-                output = await self.format_output(results["stdout"])
+                output, paste_link = await self.format_output(results["stdout"])
 
             icon = self.get_status_emoji(results)
             msg = f"{ctx.author.mention} {icon} {msg}.\n\n```\n{output}\n```"
+            if paste_link:
+                msg = f"{msg}\nFull output: {paste_link}"
 
             log.info(f"{ctx.author}'s job had a return code of {results['returncode']}")
             return await ctx.send(msg)
@@ -208,6 +377,19 @@ class Snekbox(commands.Cog):
                 break
             log.info(f"Re-evaluating code from message {ctx.message.id}:\n{code}")
 
+    @commands.command(name="evalstats")
+    async def eval_stats(self, ctx):
+        """Show the eval queue length and latencies"""
+        scheduler = self.scheduler
+        await ctx.send_embed(
+            f"running: {scheduler.running}/{scheduler.concurrency}\n" +
+            f"queued: {scheduler.waiting}/{scheduler.max_queued}\n" +
+            f"wait p50/p95: {scheduler.wait_latency.quantile(0.5):.2f}s / {scheduler.wait_latency.quantile(0.95):.2f}s\n" +
+            f"run p50/p95: {scheduler.run_latency.quantile(0.5):.2f}s / {scheduler.run_latency.quantile(0.95):.2f}s\n" +
+            f"jobs finished: {scheduler.run_latency.count}\n" +
+            f"cache hits/misses: {self.results.hits} / {self.results.misses}",
+            name="Eval queue")
+
     async def continue_eval(self, ctx, response):
         """
         Check if the eval session should continue.
@@ -0,0 +1,156 @@
+import os
+import sys
+import random
+import logging
+import resource
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+from discord.ext.commands import has_permissions
+
+from .utils import metrics
+
+log = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+MEMORY_SAMPLE_SIZE = 200
+
+# referenced by every member, they are not part of its own footprint
+SHARED_TYPES = (discord.Guild, discord.Role, discord.ClientUser, discord.Emoji)
+
+
+def deep_sizeof(obj, seen=None, depth=4):
+    """approximate size of obj with the objects it owns (slots, dicts and containers)"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, SHARED_TYPES) or type(obj).__name__ == "ConnectionState":
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if depth == 0 or isinstance(obj, (str, bytes, int, float)):
+        return size
+
+    if isinstance(obj, dict):
+        children = [*obj.keys(), *obj.values()]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = list(obj)
+    else:
+        slots = (slot for cls in type(obj).__mro__ for slot in getattr(cls, "__slots__", ()))
+        children = [getattr(obj, slot) for slot in slots if slot != "__weakref__" and hasattr(obj, slot)]
+        children.extend(getattr(obj, "__dict__", {}).values())
+
+    return size + sum(deep_sizeof(child, seen, depth - 1) for child in children)
+
+
+class Stats(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.runner = None
+
+        self.bot.loop.create_task(self.start_server())
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    async def start_server(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        except OSError:
+            log.exception("failed to start the metrics endpoint on %s:%d, the metrics will not be served",
+                          METRICS_HOST, METRICS_PORT)
+            await runner.cleanup()
+            return
+
+        self.runner = runner
+        log.info("metrics endpoint listening on %s:%d", METRICS_HOST, METRICS_PORT)
+
+    @staticmethod
+    async def handle_metrics(_request):
+        return web.Response(text=metrics.REGISTRY.render(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    @staticmethod
+    def format_top(name, label_fmt, limit=5):
+        rows = []
+        for labels, histogram in metrics.REGISTRY.top(name, limit=limit):
+            labels = dict(labels)
+            rows.append(f"`{label_fmt.format(**labels)}` " +
+                        f"{histogram.count}x, total {histogram.sum:.2f}s, p95 {histogram.quantile(0.95):.3f}s")
+        return "\n".join(rows) or "no data yet"
+
+    @commands.group(invoke_without_command=True)
+    @has_permissions(administrator=True)
+    async def stats(self, ctx):
+        """Show which event handlers and commands take the most time"""
+        loop_lag = metrics.REGISTRY.histogram("event_loop_lag_seconds")
+        pool_wait = metrics.REGISTRY.histogram("db_pool_acquire_seconds")
+
+        await ctx.send_embed(self.format_top("event_handler_seconds", "{handler}"), name="Event handlers")
+        await ctx.send_embed(self.format_top("command_seconds", "{command}"), name="Commands")
+        await ctx.send_embed(
+            f"event loop lag: last {self.bot.loop_lag * 1000:.1f}ms, p95 {loop_lag.quantile(0.95) * 1000:.0f}ms\n" +
+            f"pool checkout: {pool_wait.count}x, p95 {pool_wait.quantile(0.95) * 1000:.0f}ms",
+            name="Health")
+
+    @stats.command(name="memory")
+    @has_permissions(administrator=True)
+    async def stats_memory(self, ctx):
+        """Show how much memory the member cache takes"""
+        members = [member for guild in self.bot.guilds for member in guild.members]
+        sample = random.sample(members, min(len(members), MEMORY_SAMPLE_SIZE))
+        per_member = sum(map(deep_sizeof, sample)) / len(sample) if sample else 0
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        chunked = sum(guild.chunked for guild in self.bot.guilds)
+        lean = not self.bot.intents.presences
+        await ctx.send_embed(
+            f"cache mode: {'lean' if lean else 'full'}, {chunked}/{len(self.bot.guilds)} guilds chunked\n" +
+            f"cached members: {len(members)}, users: {len(self.bot.users)}\n" +
+            f"~{per_member:.0f} B per member, ~{per_member * len(members) / 2**20:.1f} MiB in total\n" +
+            f"peak RSS: {max_rss:.0f} MiB",
+            name="Memory")
+
+    @stats.command(name="shards")
+    @has_permissions(administrator=True)
+    async def stats_shards(self, ctx):
+        """Show the latency, guilds and gateway state of every shard"""
+        latencies = dict(self.bot.latencies)
+        rows = []
+        for shard_id in sorted(self.bot.shards):
+            health = self.bot.get_shard_health(shard_id)
+            guilds = len(self.bot.shard_guilds(shard_id))
+            rows.append(f"`shard {shard_id}` {health.status} since {health.since:%Y-%m-%d %H:%M:%S}, " +
+                        f"{latencies.get(shard_id, float('nan')) * 1000:.0f}ms, {guilds} guilds, " +
+                        f"{health.disconnects} disconnects")
+
+        await ctx.send_embed("\n".join(rows) or "no shards connected",
+                             name=f"Shards ({self.bot.shard_count or 1} in total)")
+
+    @stats.command(name="queries")
+    @has_permissions(administrator=True)
+    async def stats_queries(self, ctx, limit: int = 10):
+        """Show the database statements taking the most time"""
+        rows = []
+        for labels, histogram in metrics.REGISTRY.top("db_query_seconds", limit=limit):
+            name = dict(labels)["statement"]
+            affected = metrics.REGISTRY.counter("db_query_rows", statement=name).value
+            pool_wait = metrics.REGISTRY.histogram("db_statement_pool_wait_seconds", statement=name)
+            rows.append(f"`{name}` {histogram.count}x, total {histogram.sum:.2f}s, " +
+                        f"p95 {histogram.quantile(0.95) * 1000:.0f}ms, {affected} rows, " +
+                        f"pool wait p95 {pool_wait.quantile(0.95) * 1000:.0f}ms")
+
+        await ctx.send_embed("\n".join(rows) or "no data yet", name="Database statements")
+
+
+def setup(bot):
+    bot.add_cog(Stats(bot))
@@ -1,20 +1,23 @@
+import csv
+import json
 import logging
-from collections import defaultdict
+from collections import Counter
 from textwrap import dedent
 
-from discord import Color, Embed, PermissionOverwrite, HTTPException, Member
+import aiohttp
+
+from discord import Color, Embed, PermissionOverwrite, Member, TextChannel, CategoryChannel
 from discord.ext import commands
 from discord.ext.commands import has_permissions
 from discord.errors import NotFound
-from discord.utils import get, find
 
-from .utils import constants
+from .utils import constants, paginator, scheduler
+from .utils.router import route
 
 
 log = logging.getLogger(__name__)
 
 
-ERR_EMBED_BODY_TOO_LONG = 50035
 SUBJECT_MESSAGE = {
     "body": dedent("""
         :warning: předmět si můžeš zapsat/zrušit každých 5 sekund
@@ -26,11 +29,12 @@ SUBJECT_MESSAGE = {
         !subject add FF:CJL09
         !subject remove FF:CJL09
         ```
-        na předměty které si můžeš pridat použij !subject search <pattern>%
+        na předměty které si můžeš pridat použij !subject search <kód nebo název>
         např.
         ```yaml
         !subject find IB000
         !subject find IB0%
+        !subject find matematika
         ```
         Podporované fakulty:
         informatika (FI), filozofická (FF), sociálních studií (FSS), Sportovních studií (FSpS), Přírodovědecká (PřF), Právnická (PrF)
@@ -51,9 +55,192 @@ class ChannelNotFound(Exception):
                 f"looked for {self.searched}. Did you mean {self.potential}?")
 
 
+CATALOG_COLUMNS = ("faculty", "code", "name", "url", "terms")
+
+
+MAX_REPORTED_LINES = 20
+MAX_CATALOG_LINE = 2 ** 16  # bytes
+CATALOG_CHUNK = 2 ** 16
+
+
+async def iter_lines(chunks, max_length=MAX_CATALOG_LINE):
+    """
+    split the byte chunks into lines, a line longer than max_length
+    is not buffered whole and is yielded as None instead
+    """
+    buffer = b""
+    too_long = False
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield None if too_long else line
+            too_long = False
+        if len(buffer) > max_length:
+            buffer = b""
+            too_long = True
+
+    if buffer or too_long:
+        yield None if too_long else buffer
+
+
+def parse_catalog_row(line, fmt):
+    """
+    parse a single catalog row into a (faculty, code, name, url, terms) tuple,
+    raises ValueError when the row is malformed
+
+    csv rows have the terms separated by a semicolon,
+    json lines have the terms as a list
+    """
+    if fmt == "jsonl":
+        row = json.loads(line)
+        if not isinstance(row, dict) or any(column not in row for column in CATALOG_COLUMNS):
+            raise ValueError(f"expected an object with the keys {', '.join(CATALOG_COLUMNS)}")
+        faculty, code, name, url, terms = (row[column] for column in CATALOG_COLUMNS)
+        if not isinstance(terms, list) or not all(isinstance(term, str) for term in terms):
+            raise ValueError("terms must be a list of strings")
+    else:
+        fields = next(csv.reader([line]))
+        if len(fields) != len(CATALOG_COLUMNS):
+            raise ValueError(f"expected {len(CATALOG_COLUMNS)} columns, got {len(fields)}")
+        faculty, code, name, url, terms = fields
+        terms = [term.strip() for term in terms.split(";") if term.strip()]
+
+    if not all(isinstance(value, str) for value in (faculty, code, name, url)):
+        raise ValueError("faculty, code, name and url must be strings")
+    if not faculty.strip() or not code.strip():
+        raise ValueError("faculty and code must not be empty")
+    return (faculty.strip(), code.strip(), name, url, terms)
+
+
+class GuildChannelIndex:
+    """
+    lookup tables of a single guild's text channels and categories,
+    so that resolving a subject channel does not scan all the channels
+    """
+
+    CATEGORY_LIMIT = 50
+
+    def __init__(self, guild):
+        # name (code) -> {channel id: channel}, more channels can share a name
+        self.by_name = {}
+        self.by_code = {}
+        self.categories = {}
+        self.category_sizes = Counter()
+
+        # channel id -> (name, category id) the channel is indexed under
+        self.indexed = {}
+
+        for channel in guild.channels:
+            self.add(channel)
+
+    @staticmethod
+    def code_of(channel_name):
+        return channel_name.split("-", 1)[0].lower()
+
+    def add(self, channel):
+        """
+        index the channel, a channel that is indexed already is re-indexed,
+        the command creating a channel and the gateway event both add it
+        """
+        self.remove(channel)
+        category_id = getattr(channel, "category_id", None)
+        self.indexed[channel.id] = (channel.name, category_id)
+
+        if isinstance(channel, CategoryChannel):
+            self._add_under(self.categories, channel.name, channel)
+            return
+
+        if category_id is not None:
+            self.category_sizes[category_id] += 1
+
+        if isinstance(channel, TextChannel):
+            self._add_under(self.by_name, channel.name, channel)
+            self._add_under(self.by_code, self.code_of(channel.name), channel)
+
+    def remove(self, channel):
+        """remove the channel under the name and category it was indexed with"""
+        if (indexed := self.indexed.pop(channel.id, None)) is None:
+            return
+        name, category_id = indexed
+
+        if isinstance(channel, CategoryChannel):
+            self._remove_under(self.categories, name, channel)
+            return
+
+        if category_id is not None:
+            self.category_sizes[category_id] -= 1
+
+        if isinstance(channel, TextChannel):
+            self._remove_under(self.by_name, name, channel)
+            self._remove_under(self.by_code, self.code_of(name), channel)
+
+    @staticmethod
+    def _add_under(mapping, key, channel):
+        mapping.setdefault(key, {})[channel.id] = channel
+
+    @staticmethod
+    def _remove_under(mapping, key, channel):
+        if (channels := mapping.get(key)) is not None:
+            channels.pop(channel.id, None)
+            if not channels:
+                del mapping[key]
+
+    @staticmethod
+    def _first(channels):
+        return next(iter(channels.values()), None) if channels else None
+
+    def get_channel(self, name):
+        return self._first(self.by_name.get(name))
+
+    def find_subject_channel(self, faculty, code):
+        return self._first(self.by_code.get(code.lower()) or
+                           self.by_code.get(f"{faculty}꞉{code}".lower()))
+
+    def find_by_prefix(self, prefix):
+        """first channel whose name starts with the prefix, scans all the channels"""
+        prefix = prefix.lower()
+        return next((self._first(channels) for name, channels in self.by_name.items()
+                     if name.lower().startswith(prefix)), None)
+
+    def get_category(self, name):
+        return self._first(self.categories.get(name))
+
+    def free_slots(self, category):
+        return self.CATEGORY_LIMIT - self.category_sizes[category.id]
+
+
+class SubjectChannelIndex:
+    """
+    per-guild index of subject channels (code -> channel)
+    and categories (name -> category, category -> free slots),
+    built lazily and maintained from the channel events
+    """
+
+    def __init__(self):
+        self.guilds = {}
+
+    def __getitem__(self, guild):
+        if (index := self.guilds.get(guild.id)) is None:
+            index = self.guilds[guild.id] = GuildChannelIndex(guild)
+        return index
+
+    def add(self, channel):
+        if channel.guild.id in self.guilds:
+            self.guilds[channel.guild.id].add(channel)
+
+    def remove(self, channel):
+        if channel.guild.id in self.guilds:
+            self.guilds[channel.guild.id].remove(channel)
+
+    def forget(self, guild):
+        self.guilds.pop(guild.id, None)
+
+
 class Subject(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.index = SubjectChannelIndex()
+        self.subject_cache = {}
 
     @commands.group(name="subject", aliases=["subjects"], invoke_without_command=True)
     async def subject(self, ctx):
@@ -133,12 +320,21 @@ class Subject(commands.Cog):
                 delete_after=10)
 
     @subject.command(aliases=["search", "lookup"])
-    async def find(self, ctx, pattern):
-        faculty, code = pattern.split(":", 1) if ":" in pattern else ["FI", pattern]
+    async def find(self, ctx, *, pattern):
+        """
+        Find subjects by their code or name
 
-        subjects = await self.bot.db.subjects.find(code, faculty)
-        grouped_by_term = self.group_by_term(subjects)
-        await self.display_list_of_subjects(ctx, grouped_by_term)
+        the results are ranked by trigram similarity, so typos are fine,
+        patterns containing % or _ are matched with LIKE on the code instead
+        """
+        faculty, query = pattern.split(":", 1) if ":" in pattern else ["FI", pattern]
+
+        if "%" in query or "_" in query:
+            subjects = await self.bot.db.subjects.find(query, faculty)
+        else:
+            subjects = await self.bot.db.subjects.search(query, faculty)
+
+        await self.display_list_of_subjects(ctx, subjects)
 
     @subject.command()
     async def status(self, ctx, pattern):
@@ -171,6 +367,61 @@ class Subject(commands.Cog):
         embed.set_footer(text=SUBJECT_MESSAGE['footer'])
         await menu_text_channel.send(embed=embed)
 
+    @subject.command(name="import")
+    @has_permissions(administrator=True)
+    async def _import(self, ctx):
+        """
+        Import the subject catalog from the attached file
+
+        the file is either a csv with the columns faculty,code,name,url,terms
+        (terms separated by a semicolon) or json lines with the same keys
+        """
+        if not ctx.message.attachments:
+            await ctx.send_error("attach the catalog as a .csv or .jsonl file")
+            return
+
+        attachment = ctx.message.attachments[0]
+        fmt = "jsonl" if attachment.filename.endswith((".jsonl", ".json")) else "csv"
+        log.info("importing subject catalog %s", attachment.filename)
+
+        async with ctx.typing():
+            timeout = aiohttp.ClientTimeout(total=None, sock_read=60.0)
+            async with self.bot.session.get(attachment.url, raise_for_status=True, timeout=timeout) as resp:
+                rejected = []
+                records = self.read_catalog(resp.content.iter_chunked(CATALOG_CHUNK), fmt, rejected)
+                inserted, updated, deleted = await self.bot.db.subjects.import_catalog(records, rejected)
+
+        self.bot.dispatch("subject_catalog_update")
+        log.info("subject catalog imported, %d inserted, %d updated, %d deleted, %d lines rejected",
+                 inserted, updated, deleted, len(rejected))
+        message = f"Catalog imported: {inserted} inserted, {updated} updated, {deleted} deleted"
+        if rejected:
+            lines = ", ".join(str(line_number) for line_number, _error in rejected[:MAX_REPORTED_LINES])
+            more = f" and {len(rejected) - MAX_REPORTED_LINES} more" if len(rejected) > MAX_REPORTED_LINES else ""
+            message += (f"\nskipped {len(rejected)} invalid lines ({lines}{more}), " +
+                        "nothing was deleted, fix them and import again")
+        await ctx.send_success(message)
+
+    @staticmethod
+    async def read_catalog(chunks, fmt, rejected):
+        """yield the valid rows, the (line number, error) of the invalid ones are appended to rejected"""
+        line_number = 0
+        async for line in iter_lines(chunks, MAX_CATALOG_LINE):
+            line_number += 1
+            try:
+                if line is None:
+                    raise ValueError(f"the line is longer than {MAX_CATALOG_LINE} bytes")
+                line = line.decode("utf-8-sig").strip()
+                if not line or line.lower() == ",".join(CATALOG_COLUMNS):
+                    continue
+                row = parse_catalog_row(line, fmt)
+            except ValueError as error:
+                # UnicodeDecodeError and json.JSONDecodeError are ValueErrors too
+                log.warning("skipping line %d of the subject catalog: %s", line_number, error)
+                rejected.append((line_number, str(error)))
+                continue
+            yield row
+
     @subject.command()
     @has_permissions(administrator=True)
     async def recover_database(self, ctx):
@@ -208,9 +459,10 @@ class Subject(commands.Cog):
 
             old_category = channel.category
             new_category_name = row.get("category_name")
-            new_category = get(guild.categories, name=new_category_name)
+            new_category = self.index[guild].get_category(new_category_name)
             if not new_category:
                 new_category = await guild.create_category(new_category_name)
+                self.index.add(new_category)
 
             await channel.edit(category=new_category)
 
@@ -227,9 +479,16 @@ class Subject(commands.Cog):
         return await self.bot.db.subjects.find(code, faculty)
 
     async def find_subject(self, code, faculty="FI"):
+        key = (faculty.lower(), code.lower())
+        if key in self.subject_cache:
+            return self.subject_cache[key]
+
         subjects = await self.bot.db.subjects.find(code, faculty)
         if len(subjects) != 1:
             return None
+
+        if "%" not in code and "_" not in code:
+            self.subject_cache[key] = subjects[0]
         return subjects[0]
 
     async def try_to_sign_user_to_channel(self, ctx, subject):
@@ -260,12 +519,7 @@ class Subject(commands.Cog):
             return await self.lookup_channel(ctx, subject)
 
     async def try_to_get_existing_channel(self, ctx, subject):
-        def is_subject_channel(channel):
-            faculty, code = subject.get("faculty"), subject.get("code")
-            return (channel.name.startswith(code) or
-                    channel.name.startswith(f"{faculty}꞉{code}"))
-
-        channel = find(is_subject_channel, ctx.guild.text_channels)
+        channel = self.index[ctx.guild].find_subject_channel(subject.get("faculty"), subject.get("code"))
         if channel is not None:
             await self.bot.db.subjects.set_channel(ctx.guild.id, subject.get("code"), channel.id)
         return channel
@@ -278,7 +532,7 @@ class Subject(commands.Cog):
                 len(registers.get("member_ids")) >= constants.NEEDED_REACTIONS)
 
     async def lookup_channel(self, ctx, subject, recreate=True):
-        channel = get(ctx.guild.text_channels, name=self.subject_to_channel_name(ctx, subject))
+        channel = self.index[ctx.guild].get_channel(self.subject_to_channel_name(ctx, subject))
         if channel is None and recreate:
             channel = await self.remove_channel_from_database_and_retry(ctx, subject)
         if channel is None:
@@ -289,7 +543,7 @@ class Subject(commands.Cog):
         faculty = subject.get('faculty')
         code = subject.get('code')
         channel_name = self.subject_to_channel_name(ctx, subject)
-        potential = find(lambda channel: channel.name.lower().startswith(code.lower()), ctx.guild.text_channels)
+        potential = self.index[ctx.guild].find_by_prefix(code)
         raise ChannelNotFound(subject=f"{faculty}:{code}", searched=channel_name, potential=potential)
 
     async def remove_channel_from_database_and_retry(self, ctx, subject):
@@ -332,6 +586,7 @@ class Subject(commands.Cog):
             category=category,
             overwrites=overwrites
         )
+        self.index.add(channel)
         data = await self.bot.db.channels.prepare([channel])
         await self.bot.db.channels.insert(data)
 
@@ -342,10 +597,11 @@ class Subject(commands.Cog):
         return channel
 
     async def create_or_get_category(self, ctx, subject):
+        index = self.index[ctx.guild]
         row = await self.bot.db.subjects.get_category(ctx.guild.id, subject.get("code"))
         if row:
             category_name = row.get("category_name")
-            if category := get(ctx.guild.categories, name=category_name):
+            if category := index.get_category(category_name):
                 return category
             category = await ctx.guild.create_category(category_name)
 
@@ -353,57 +609,45 @@ class Subject(commands.Cog):
             i = 1
             while True:
                 category_name = "{faculty} {i}".format(faculty=subject.get("faculty"), i = i if i != 0 else '').strip()
-                if category := get(ctx.guild.categories, name=category_name):
-                    if len(category.channels) < 50:
+                if category := index.get_category(category_name):
+                    if index.free_slots(category) > 0:
                         return category
                     i += 1
                 else:
                     category = await ctx.guild.create_category(category_name)
                     break
 
+        self.index.add(category)
         await self.bot.db.categories.insert(await self.bot.db.categories.prepare([category]))
         return category
 
-    @staticmethod
-    def group_by_term(subjects):
-        grouped_by_term = defaultdict(list)
-        for subject in subjects:
-            for term in subject.get("terms"):
-                grouped_by_term[term].append(subject)
-        return grouped_by_term
-
-    async def display_list_of_subjects(self, ctx, grouped_by_term):
+    async def display_list_of_subjects(self, ctx, subjects):
         def prepare(subject):
             faculty = subject.get("faculty")
             code = subject.get("code")
             name = subject.get("name")
             url = subject.get("url")
-            return f"**[{faculty}:{code}]({url})** {name}"
+            terms = ", ".join(subject.get("terms"))
+            return f"**[{faculty}:{code}]({url})** {name} *{terms}*"
 
-        embed = Embed(color=constants.MUNI_YELLOW)
-        if not grouped_by_term:
-            embed.add_field(
-                inline=False,
+        if not subjects:
+            await ctx.send_embed(
+                "you can search by the subject code or name, or add % to match a pattern",
                 name="No subjects found",
-                value="you can add % to the beginning or the end to match a pattern")
-
-        for term, subjects_in_term in grouped_by_term.items():
-            embed.add_field(
-                inline=False,
-                name=term,
-                value="\n".join(prepare(subject) for subject in subjects_in_term))
+                color=constants.MUNI_YELLOW)
+            return
 
         try:
-            await ctx.send(embed=embed)
-        except HTTPException as err:
-            if err.code == ERR_EMBED_BODY_TOO_LONG:
-                await ctx.send_error("Found too many results to display, please be more specific")
+            pages = paginator.Pages(ctx, entries=[prepare(subject) for subject in subjects],
+                                    per_page=10, template="{entry}")
+        except paginator.CannotPaginate as err:
+            await ctx.send_error(str(err))
+        else:
+            pages.embed.colour = constants.MUNI_YELLOW
+            await pages.paginate()
 
-    @commands.Cog.listener()
+    @route("message", channels=constants.subject_registration_channels)
     async def on_message(self, message):
-        if message.channel.id not in constants.subject_registration_channels:
-            return
-
         if message.author.id == self.bot.user.id and message.embeds:
             if message.embeds[0].description == SUBJECT_MESSAGE['body']:
                 return
@@ -418,19 +662,56 @@ class Subject(commands.Cog):
             pass
 
     @commands.Cog.listener()
-    async def on_ready(self):
+    async def on_guild_channel_create(self, channel):
+        self.index.add(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.name == after.name and before.category_id == after.category_id:
+            return
+
+        self.index.remove(before)
+        self.index.add(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.index.remove(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.index.forget(guild)
+
+    @commands.Cog.listener()
+    async def on_subject_catalog_update(self):
+        self.subject_cache.clear()
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        # the shard re-identified, discord.py built new guild and channel objects
+        # and the channel events while it was offline were missed
+        for guild in self.bot.shard_guilds(shard_id):
+            self.index.forget(guild)
+
+        self.bot.scheduler.submit(f"subject.cleanup.{shard_id}", lambda: self.cleanup(shard_id),
+                                  priority=scheduler.NORMAL)
+
+    async def cleanup(self, shard_id=None):
+        guilds = self.bot.shard_guilds(shard_id)
         for channel_id in constants.subject_registration_channels:
             if not (channel := self.bot.get_channel(channel_id)):
                 continue
+            if channel.guild not in guilds:
+                continue
 
             async for message in channel.history():
                 if message.author.id == self.bot.user.id and message.embeds:
                     if message.embeds[0].description == SUBJECT_MESSAGE['body']:
                         continue
 
+                await self.bot.scheduler.throttle()
                 await message.delete()
 
-        for guild in self.bot.guilds:
+        for guild in guilds:
             for category in guild.categories:
                 if ':' not in category.name:
                     continue
@@ -440,6 +721,7 @@ class Subject(commands.Cog):
                     continue
 
                 for i, channel in enumerate(ordered):
+                    await self.bot.scheduler.throttle()
                     await channel.edit(position=i)
 
 
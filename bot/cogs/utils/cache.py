@@ -0,0 +1,77 @@
+import re
+import time
+import hashlib
+from collections import OrderedDict
+
+
+NOCACHE_REGEX = re.compile(r"(?:#|//|--)\s*nocache\b", re.IGNORECASE)
+
+
+def content_key(*parts):
+    """hash of the parts, used to address the same content regardless of where it came from"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def has_nocache_marker(code):
+    """code can opt out of caching with a `# nocache` or `// nocache` comment"""
+    return NOCACHE_REGEX.search(code) is not None
+
+
+class LRUCache:
+    """
+    least recently used cache whose entries expire after ttl seconds
+    and whose total size is bounded by max_bytes
+    """
+
+    def __init__(self, max_bytes, ttl, *, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, _size, value = entry
+        if expires_at <= self.clock():
+            self.pop(key)
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+
+        self.pop(key)
+        self.entries[key] = (self.clock() + self.ttl, size, value)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _key, (_expires_at, oldest_size, _value) = self.entries.popitem(last=False)
+            self.size -= oldest_size
+
+    def pop(self, key):
+        if (entry := self.entries.pop(key, None)) is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -3,14 +3,52 @@
 # pylint: disable=line-too-long
 
 
+import os
+import re
+import time
 import asyncio
+import inspect
+import logging
+import functools
+import contextvars
 import asyncpg
+from typing import NamedTuple
+from datetime import datetime
+from contextlib import asynccontextmanager
+
+from bot.cogs.utils import metrics, emotes
+
+log = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+current_statement = contextvars.ContextVar("current_statement", default="<unknown>")
+
+
+def statement(name, fn):
+    """run fn with name as the label of every query it sends"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = current_statement.set(name)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            current_statement.reset(token)
+    return wrapper
 
 
 class Table:
     def __init__(self, db):
         self.db = db
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # label the queries with the method sending them, e.g. Leaderboard.refresh
+        for name, attr in list(vars(cls).items()):
+            if inspect.iscoroutinefunction(attr) and not name.startswith("prepare"):
+                setattr(cls, name, statement(f"{cls.__name__}.{name}", attr))
+
     async def prepare_one(self, obj):
         raise NotImplementedError("prepare_one form object not implemented for this table")
 
@@ -120,10 +158,18 @@ class Roles(Table):
             await conn.executemany("UPDATE server.roles SET deleted_at=NOW() WHERE id = $1;", ids)
 
 
+class UserRow(NamedTuple):
+    """row of server.users, the fields are named so the ingestion worker can fingerprint it"""
+    id: int
+    name: str
+    avatar_url: str
+    created_at: datetime
+
+
 class Members(Table):
     @staticmethod
     async def prepare_one(member):
-        return (member.id, member.name, str(member.avatar_url), member.created_at)
+        return UserRow(member.id, member.name, str(member.avatar_url), member.created_at)
 
     async def prepare(self, members):
         return [await self.prepare_one(member) for member in members]
@@ -184,6 +230,15 @@ class Channels(Table):
 
 
 class Messages(Table):
+    """
+    server.messages is partitioned by month of created_at,
+    the partitions are created on demand before inserting
+    """
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.partitions = set()
+
     @staticmethod
     async def prepare_one(message):
         return (message.channel.id, message.author.id, message.id, message.content, message.created_at, message.edited_at)
@@ -191,17 +246,24 @@ class Messages(Table):
     async def prepare(self, message):
         return [await self.prepare_one(message)]
 
+    async def ensure_partitions(self, conn, messages):
+        months = {created_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                  for (_, _, _, _, created_at, _) in messages}
+        for month in months - self.partitions:
+            await conn.execute("SELECT server.ensure_messages_partition($1)", month)
+            self.partitions.add(month)
+
     async def insert(self, messages):
         async with self.db.acquire() as conn:
+            await self.ensure_partitions(conn, messages)
             await conn.executemany("""
-                INSERT INTO server.messages AS m (channel_id, author_id, id, content, created_at, edited_at)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (id) DO UPDATE
+                INSERT INTO server.messages AS m (channel_id, author_id, id, content, created_at, edited_at, content_tsv)
+                VALUES ($1, $2, $3, $4, $5, $6, to_tsvector('server.czech_english', $4))
+                ON CONFLICT (id, created_at) DO UPDATE
                     SET content=$4,
-                        created_at=$5,
-                        edited_at=$6
+                        edited_at=$6,
+                        content_tsv=excluded.content_tsv
                     WHERE m.content<>excluded.content OR
-                          m.created_at<>excluded.created_at OR
                           m.edited_at<>excluded.edited_at
             """, messages)
 
@@ -209,8 +271,39 @@ class Messages(Table):
         await self.insert(messages)
 
     async def soft_delete(self, ids):
+        """ids are (id, created_at) so that only the partition of the message is scanned"""
         async with self.db.acquire() as conn:
-            await conn.executemany("UPDATE server.messages SET deleted_at=NOW() WHERE id = $1;", ids)
+            await conn.executemany("UPDATE server.messages SET deleted_at=NOW() WHERE id = $1 AND created_at = $2;", ids)
+
+    async def search(self, guild_id, query, channel_ids, author_id=None, after=None, before=None, last=None, limit=10):
+        """
+        full-text search of the messages in the channels newest first, the next page
+        continues after the (created_at, id) of the last row of the previous one
+        """
+        last_created_at, last_id = (last["created_at"], last["id"]) if last is not None else (None, None)
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT m.channel_id, m.author_id, m.id, m.content, m.created_at
+                FROM server.messages AS m
+                INNER JOIN server.channels AS ch
+                    ON m.channel_id = ch.id
+                WHERE ch.guild_id = $1 AND
+                      m.deleted_at IS NULL AND
+                      m.content_tsv @@ websearch_to_tsquery('server.czech_english', $2) AND
+                      m.channel_id = ANY($3::bigint[]) AND
+                      ($4::bigint IS NULL OR m.author_id = $4) AND
+                      ($5::timestamp IS NULL OR m.created_at >= $5) AND
+                      ($6::timestamp IS NULL OR m.created_at < $6) AND
+                      ($7::timestamp IS NULL OR (m.created_at, m.id) < ($7, $8::bigint))
+                ORDER BY m.created_at DESC, m.id DESC
+                LIMIT $9
+            """, guild_id, query, channel_ids, author_id, after, before, last_created_at, last_id, limit)
+
+    async def detach_partitions(self, older_than):
+        """detach the monthly partitions older than the date so they can be archived, returns their names"""
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("SELECT server.detach_messages_partitions($1) AS name", older_than)
+        return [row["name"] for row in rows]
 
 
 class Attachments(Table):
@@ -237,9 +330,9 @@ class Attachments(Table):
 class Reactions(Table):
     @staticmethod
     async def prepare_one(reaction):
+        """the reaction is an ingest.ReactionPayload, its users are fetched by the gateway process"""
         import emoji
-        user_ids = await reaction.users().map(lambda member: member.id).flatten()
-        return (reaction.message.id, emoji.demojize(str(reaction.emoji)), user_ids)
+        return (reaction.message_id, emoji.demojize(reaction.emoji), list(reaction.user_ids))
 
     async def prepare(self, message):
         return [await self.prepare_one(reaction) for reaction in message.reactions]
@@ -254,17 +347,10 @@ class Reactions(Table):
 
 
 class Emojis(Table):
-    REGEX = r"((?::\w+(?:~\d+)?:)|(?:<\d+:\w+:>))"
-
     @staticmethod
     async def prepare(message):
-        import re
-        import emoji
-        from collections import Counter
-
-        emojis = re.findall(Emojis.REGEX, emoji.demojize(message.content))
-
-        return [(message.id, emote, count) for (emote, count) in Counter(emojis).items()]
+        emojis = emotes.extractor().count(message.content)
+        return [(message.id, emote, count) for (emote, count) in emojis.items()]
 
     async def insert(self, emojis):
         async with self.db.acquire() as conn:
@@ -327,13 +413,26 @@ class Leaderboard(Table):
                     ) AS lookup
             """, guild_id, ignored_users, channel_id)
 
+    @staticmethod
+    async def fetch_lookup(conn, query, *args):
+        """
+        preselect drops and creates ldb_lookup again, which invalidates the
+        statements cached for the old table, asyncpg evicts the statement
+        when it raises so the retry prepares it against the new table
+        """
+        try:
+            return await conn.fetch(query, *args)
+        except asyncpg.InvalidCachedStatementError:
+            log.debug("cached statement on ldb_lookup was invalidated, retrying")
+            return await conn.fetch(query, *args)
+
     async def get_top10(self):
         async with self.db.acquire() as conn:
-            return await conn.fetch("SELECT * FROM ldb_lookup LIMIT 10")
+            return await self.fetch_lookup(conn, "SELECT * FROM ldb_lookup LIMIT 10")
 
     async def get_around(self, author_id):
         async with self.db.acquire() as conn:
-            return await conn.fetch("""
+            return await self.fetch_lookup(conn, """
                 WITH desired_count AS (
                     SELECT sent_total
                     FROM ldb_lookup
@@ -381,10 +480,162 @@ class Emojiboard(Table):
             """, guild_id, ignored_users, channel_id, author_id, emoji)
 
 
+class Activity(Table):
+    async def rollup(self, from_date, to_date):
+        """
+        recount the hours (and days of the active users) touched by the range,
+        the rollups are upserted so only the recent messages are scanned
+        """
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO cogs.activity AS a (guild_id, channel_id, hour, messages_sent)
+                    SELECT channel.guild_id,
+                           messages.channel_id,
+                           date_trunc('hour', messages.created_at) AS hour,
+                           count(*) AS messages_sent
+                    FROM server.messages
+                    INNER JOIN server.channels AS channel ON messages.channel_id = channel.id
+                    WHERE messages.created_at >= date_trunc('hour', $1::timestamp) AND
+                          messages.created_at < date_trunc('hour', $2::timestamp) + interval '1 hour'
+                    GROUP BY channel.guild_id, messages.channel_id, date_trunc('hour', messages.created_at)
+                    ON CONFLICT (channel_id, hour) DO UPDATE
+                        SET messages_sent = excluded.messages_sent
+                        WHERE a.messages_sent <> excluded.messages_sent
+                """, from_date, to_date)
+                await conn.execute("""
+                    INSERT INTO cogs.activity_users AS a (guild_id, day, active_users)
+                    SELECT channel.guild_id,
+                           date_trunc('day', messages.created_at) AS day,
+                           count(DISTINCT messages.author_id) AS active_users
+                    FROM server.messages
+                    INNER JOIN server.channels AS channel ON messages.channel_id = channel.id
+                    WHERE messages.created_at >= date_trunc('day', $1::timestamp) AND
+                          messages.created_at < date_trunc('day', $2::timestamp) + interval '1 day'
+                    GROUP BY channel.guild_id, date_trunc('day', messages.created_at)
+                    ON CONFLICT (guild_id, day) DO UPDATE
+                        SET active_users = excluded.active_users
+                        WHERE a.active_users <> excluded.active_users
+                """, from_date, to_date)
+
+    async def hour_of_week(self, guild_id, since, channel_id=None):
+        """messages sent per weekday (0 is monday) and hour of the prague wall clock, at most 168 rows"""
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT (EXTRACT(ISODOW FROM local_hour) - 1)::int AS weekday,
+                       EXTRACT(HOUR FROM local_hour)::int AS hour,
+                       SUM(messages_sent)::bigint AS messages_sent
+                FROM (
+                    SELECT hour AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Prague' AS local_hour, messages_sent
+                    FROM cogs.activity
+                    WHERE guild_id = $1 AND
+                          hour >= $2 AND
+                          ($3::bigint IS NULL OR channel_id = $3)
+                ) AS activity
+                GROUP BY weekday, hour
+            """, guild_id, since, channel_id)
+
+    async def daily_channels(self, guild_id, since):
+        """messages sent per channel and day since the date, the day is in epoch seconds"""
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT channel_id,
+                       EXTRACT(EPOCH FROM date_trunc('day', hour))::bigint AS day,
+                       SUM(messages_sent)::bigint AS messages_sent
+                FROM cogs.activity
+                WHERE guild_id = $1 AND hour >= $2
+                GROUP BY channel_id, date_trunc('day', hour)
+            """, guild_id, since)
+
+    async def daily_users(self, guild_id, since):
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT EXTRACT(EPOCH FROM day)::bigint AS day, active_users
+                FROM cogs.activity_users
+                WHERE guild_id = $1 AND day >= $2
+            """, guild_id, since)
+
+
 class Subjects(Table):
     async def find(self, code, faculty="FI"):
         async with self.db.acquire() as conn:
-            return await conn.fetch("SELECT * FROM muni.subjects WHERE LOWER(code) LIKE LOWER($1) AND LOWER(faculty) = LOWER($2)", code, faculty)
+            return await conn.fetch("SELECT * FROM muni.subjects WHERE LOWER(code) LIKE LOWER($1) AND LOWER(faculty) = LOWER($2) AND deleted_at IS NULL", code, faculty)
+
+    async def search(self, query, faculty="FI", limit=100):
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT *
+                FROM (
+                    SELECT *,
+                        GREATEST(similarity(LOWER(code), LOWER($1)),
+                                 word_similarity(LOWER($1), LOWER(name))) AS rank
+                    FROM muni.subjects
+                    WHERE LOWER(faculty) = LOWER($2) AND
+                          deleted_at IS NULL AND
+                          (LOWER(code) % LOWER($1) OR LOWER($1) <% LOWER(name))
+                ) AS matches
+                ORDER BY rank DESC, code
+                LIMIT $3
+            """, query, faculty, limit)
+
+    async def import_catalog(self, records, rejected=()):
+        """
+        stream the catalog records (faculty, code, name, url, terms)
+        into a staging table using COPY and apply the difference
+        against muni.subjects in a single transaction
+
+        subjects of the imported faculties that are missing
+        from the catalog get soft deleted, unless the reader rejected
+        some lines (filled in while the records are streamed), the
+        subject of a rejected line would be missing too
+        """
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMPORARY TABLE subjects_staging
+                        (LIKE muni.subjects INCLUDING DEFAULTS)
+                        ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table(
+                    "subjects_staging",
+                    records=records,
+                    columns=("faculty", "code", "name", "url", "terms"))
+
+                upserted = await conn.fetchrow("""
+                    WITH upserted AS (
+                        INSERT INTO muni.subjects AS s (faculty, code, name, url, terms)
+                        SELECT DISTINCT ON (code) faculty, code, name, url, terms
+                        FROM subjects_staging
+                        ON CONFLICT (code) DO UPDATE
+                            SET faculty=excluded.faculty,
+                                name=excluded.name,
+                                url=excluded.url,
+                                terms=excluded.terms,
+                                edited_at=NOW(),
+                                deleted_at=NULL
+                            WHERE s.faculty<>excluded.faculty OR
+                                  s.name<>excluded.name OR
+                                  s.url<>excluded.url OR
+                                  s.terms<>excluded.terms OR
+                                  s.deleted_at IS NOT NULL
+                        RETURNING (xmax = 0) AS inserted
+                    )
+                    SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                           COUNT(*) FILTER (WHERE NOT inserted) AS updated
+                    FROM upserted
+                """)
+                if rejected:
+                    return upserted.get("inserted"), upserted.get("updated"), 0
+
+                deleted = await conn.execute("""
+                    UPDATE muni.subjects AS s
+                        SET deleted_at = NOW()
+                        WHERE s.deleted_at IS NULL AND
+                              s.faculty IN (SELECT DISTINCT faculty FROM subjects_staging) AND
+                              NOT EXISTS (SELECT 1 FROM subjects_staging AS st WHERE st.code = s.code)
+                """)
+
+        return upserted.get("inserted"), upserted.get("updated"), int(deleted.split()[-1])
 
     async def find_registered(self, guild_id, code):
         async with self.db.acquire() as conn:
@@ -493,14 +744,170 @@ class Tags(Table):
             """, guild_id, author_id, name, new_content)
 
 
+class Export(Table):
+    SOURCES = {
+        "messages": """
+            SELECT m.channel_id, m.author_id, m.id, m.content, m.created_at, m.edited_at, m.deleted_at
+            FROM server.messages AS m
+            INNER JOIN server.channels AS ch
+                ON m.channel_id = ch.id
+            WHERE ch.guild_id = $1 AND m.created_at >= $2 AND m.created_at < $3
+        """,
+        "reactions": """
+            SELECT r.message_id, m.channel_id, m.created_at, r.name, r.member_ids
+            FROM server.reactions AS r
+            INNER JOIN server.messages AS m
+                ON r.message_id = m.id
+            INNER JOIN server.channels AS ch
+                ON m.channel_id = ch.id
+            WHERE ch.guild_id = $1 AND m.created_at >= $2 AND m.created_at < $3
+        """,
+        "emojis": """
+            SELECT e.message_id, m.channel_id, m.author_id, m.created_at, e.name, e.count
+            FROM server.emojis AS e
+            INNER JOIN server.messages AS m
+                ON e.message_id = m.id
+            INNER JOIN server.channels AS ch
+                ON m.channel_id = ch.id
+            WHERE ch.guild_id = $1 AND m.created_at >= $2 AND m.created_at < $3
+        """
+    }
+
+    async def get_watermark(self, guild_id, source):
+        async with self.db.acquire() as conn:
+            return await conn.fetchval("SELECT exported_until FROM cogs.export WHERE guild_id = $1 AND source = $2", guild_id, source)
+
+    async def set_watermark(self, guild_id, source, exported_until):
+        async with self.db.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO cogs.export AS e (guild_id, source, exported_until)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (guild_id, source) DO UPDATE
+                    SET exported_until = excluded.exported_until,
+                        exported_at = NOW()
+            """, guild_id, source, exported_until)
+
+    async def stream(self, source, guild_id, from_date, to_date, batch_size=10_000):
+        """
+        yield the rows of the source in batches through a server-side cursor,
+        so neither the database nor the bot materialize the whole month
+        """
+        async with self.db.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(self.SOURCES[source], guild_id, from_date, to_date)
+                while rows := await cursor.fetch(batch_size):
+                    yield rows
+
+
+class InstrumentedConnection:
+    """
+    proxy of a pooled connection recording the latency and rows affected
+    of every query under the label of the Table method sending it,
+    queries slower than SLOW_QUERY_MS are logged with redacted parameters
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @staticmethod
+    def count_rows(method, args, result):
+        if method == "executemany":
+            return len(args[0]) if args else 0
+        if method == "fetch":
+            return len(result)
+        if method == "fetchrow":
+            return int(result is not None)
+        if isinstance(result, str) and (match := re.search(r"(\d+)$", result)):
+            # status of execute and copy, e.g. "UPDATE 3"
+            return int(match.group(1))
+        return 0
+
+    @staticmethod
+    def redact(method, args):
+        if method == "executemany":
+            return f"<{len(args[0]) if args else 0} parameter sets>"
+        return ", ".join(f"${i}=<{type(arg).__name__}>" for i, arg in enumerate(args, start=1))
+
+    async def _run(self, method, query, *args, **kwargs):
+        name = current_statement.get()
+
+        start = time.perf_counter()
+        try:
+            result = await getattr(self._conn, method)(query, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.REGISTRY.histogram("db_query_seconds", "database query latency", statement=name).observe(duration)
+
+        rows = self.count_rows(method, args, result)
+        metrics.REGISTRY.counter("db_query_rows", "rows affected by database queries", statement=name).inc(rows)
+
+        if duration * 1000 >= SLOW_QUERY_MS:
+            log.warning("slow query %s took %.0fms (%d rows): %s [%s]",
+                        name, duration * 1000, rows, " ".join(query.split())[:200], self.redact(method, args))
+        return result
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._run("execute", query, *args, **kwargs)
+
+    async def executemany(self, query, args, **kwargs):
+        return await self._run("executemany", query, args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._run("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._run("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._run("fetchval", query, *args, **kwargs)
+
+    async def copy_records_to_table(self, table_name, **kwargs):
+        return await self._run("copy_records_to_table", table_name, **kwargs)
+
+
+class Pool:
+    """
+    thin wrapper around the asyncpg pool measuring how long
+    the tables wait to get a connection out of the pool
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.acquire_latency = metrics.REGISTRY.histogram("db_pool_acquire_seconds", "database pool checkout wait")
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            wait = time.perf_counter() - start
+            self.acquire_latency.observe(wait)
+            metrics.REGISTRY.histogram("db_statement_pool_wait_seconds", "database pool checkout wait per statement",
+                                       statement=current_statement.get()).observe(wait)
+            yield InstrumentedConnection(conn)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
 class DBBase:
     def __init__(self, pool):
-        self.pool = pool
+        self.pool = Pool(pool)
 
     @classmethod
     def connect(cls, url):
         loop = asyncio.get_event_loop()
-        pool = loop.run_until_complete(asyncpg.create_pool(url, command_timeout=1280))
+        return loop.run_until_complete(cls.create(url))
+
+    @classmethod
+    async def create(cls, url):
+        # conn.fetch and friends prepare each query once per connection and keep it
+        # in asyncpg's statement cache, the hot queries are never expired from it
+        pool = await asyncpg.create_pool(
+            url, command_timeout=1280,
+            max_cached_statement_lifetime=0)
         return Database(pool)
 
 
@@ -521,5 +928,7 @@ class Database(DBBase):
         self.logger = Logger(self.pool)
         self.leaderboard = Leaderboard(self.pool)
         self.emojiboard = Emojiboard(self.pool)
+        self.activity = Activity(self.pool)
         self.subjects = Subjects(self.pool)
         self.tags = Tags(self.pool)
+        self.export = Export(self.pool)
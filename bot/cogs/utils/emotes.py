@@ -0,0 +1,146 @@
+"""
+single pass emoji extraction
+
+the unicode emoji are matched by precompiled regexes built from a trie of
+their code points, so the message is scanned once instead of being
+demojized first and searched with a second regex after that. The names
+are the same as emoji.demojize gives (:thumbs_up:), custom discord
+emoji <:name:id> and typed :name: are named by their :name:
+
+run this module for a benchmark against demojize + re.findall
+"""
+import re
+import functools
+from collections import Counter
+
+CUSTOM_REGEX = r"<a?:\w+:\d+>"
+TEXT_REGEX = r":\w+(?:~\d+)?:"
+
+
+def trie_regexes(words):
+    """
+    regex per first character matching the longest of the words
+    starting with it, the words share their common prefixes
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_regex(node):
+        leaves = sorted(char for char, child in node.items() if char and list(child) == [""])
+        branches = [re.escape(char) + to_regex(child)
+                    for char, child in sorted(node.items()) if char and list(child) != [""]]
+        if leaves:
+            branches.append(re.escape(leaves[0]) if len(leaves) == 1 else
+                            "[" + "".join(map(re.escape, leaves)) + "]")
+
+        if not branches:
+            return ""
+        regex = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # a word ends here, the rest is optional and greedy so the longest word wins
+        return f"(?:{regex})?" if "" in node else regex
+
+    return {char: re.escape(char) + to_regex(child) for char, child in trie.items()}
+
+
+def char_class(chars):
+    """
+    character class of consecutive ranges, sre checks the astral
+    characters of a class one by one and the emoji are clustered
+    """
+    ranges = []
+    for code in sorted(map(ord, chars)):
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return "[" + "".join(re.escape(chr(first)) + ("-" + re.escape(chr(last)) if last != first else "")
+                         for first, last in ranges) + "]"
+
+
+class EmoteExtractor:
+    """
+    the text is searched for the characters an emoji can start with (one
+    character class), the first character picks the small regex matching the rest
+    """
+
+    def __init__(self, emoji_data):
+        self.names = {emoji: data["en"] for emoji, data in emoji_data.items()}
+
+        regexes = {**trie_regexes(self.names), "<": CUSTOM_REGEX, ":": TEXT_REGEX}
+        self.regexes = {char: re.compile(regex) for char, regex in regexes.items()}
+        self.start = re.compile(char_class(regexes))
+
+    def finditer(self, text):
+        pos = 0
+        while (start := self.start.search(text, pos)) is not None:
+            pos = start.start()
+            char = text[pos]
+            if (match := self.regexes[char].match(text, pos)) is None:
+                pos += 1
+                continue
+
+            pos = match.end()
+            emote = match.group()
+            if char == "<":
+                yield f":{emote.split(':')[1]}:"
+            elif char == ":":
+                yield emote
+            else:
+                yield self.names[emote]
+
+    def findall(self, text):
+        return list(self.finditer(text))
+
+    def count(self, text):
+        return Counter(self.finditer(text))
+
+    def first(self, text):
+        return next(self.finditer(text), None)
+
+
+@functools.lru_cache(maxsize=None)
+def extractor():
+    """the extractor is compiled once per process on first use"""
+    from emoji import EMOJI_DATA
+    return EmoteExtractor(EMOJI_DATA)
+
+
+if __name__ == "__main__":
+    import time
+    import random
+    import emoji
+
+    REGEX = r"((?::\w+(?:~\d+)?:)|(?:<\d+:\w+:>))"
+
+    def baseline(text):
+        return Counter(re.findall(REGEX, emoji.demojize(text)))
+
+    def benchmark(name, fn, messages):
+        start = time.perf_counter()
+        for message in messages:
+            fn(message)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {len(messages) / elapsed:>12,.0f} messages/s")
+
+    random.seed(0)
+    words = "ahoj jak se mas dneska je to test predmet zapocet zkouska ib111 fi muni".split()
+    unicode_emoji = random.sample(list(emoji.EMOJI_DATA), 200)
+    custom_emoji = ["<:pepe:601085412343>", "<a:kekw:601085412344>", ":hyperjoseph:"]
+
+    messages = []
+    for _ in range(20_000):
+        tokens = random.choices(words, k=random.randint(3, 30))
+        for _ in range(random.choice((0, 0, 1, 2, 4))):
+            tokens.insert(random.randrange(len(tokens) + 1), random.choice(unicode_emoji + custom_emoji))
+        messages.append(" ".join(tokens))
+
+    start = time.perf_counter()
+    compiled = extractor()
+    print(f"compiled the extractor in {time.perf_counter() - start:.2f}s")
+
+    benchmark("demojize + re.findall", baseline, messages)
+    benchmark("EmoteExtractor.count", compiled.count, messages)
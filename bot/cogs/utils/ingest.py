@@ -0,0 +1,375 @@
+"""
+archive ingestion in a separate worker process
+
+discord objects hold the connection state and cannot leave the gateway
+process, so the logger sends picklable snapshots of the messages over
+a multiprocessing queue. The worker prepares the rows (emoji parsing,
+demojizing) and runs the database writes in batches on its own core.
+The other rows of the logger (guilds, channels, users...) go through
+the worker too, so the parents are written before the messages.
+"""
+import queue
+import asyncio
+import logging
+import functools
+import itertools
+import multiprocessing
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+import asyncpg
+
+log = logging.getLogger(__name__)
+
+INGEST_QUEUE_SIZE = 10_000
+INGEST_BATCH_SIZE = 550
+INGEST_FLUSH_INTERVAL = 5.0  # seconds the live messages wait at most before they are written
+INGEST_STOP_TIMEOUT = 30.0
+INGEST_SEND_TIMEOUT = 60.0
+INGEST_ACK_TIMEOUT = 600.0
+INGEST_ALIVE_INTERVAL = 5.0  # how often a waiting flush checks that the worker is still running
+SEEN_USERS_LIMIT = 100_000
+
+STOP = None
+
+
+class ChannelRef(NamedTuple):
+    id: int
+
+
+class AuthorPayload(NamedTuple):
+    id: int
+    name: str
+    avatar_url: str
+    created_at: datetime
+
+
+class AttachmentPayload(NamedTuple):
+    id: int
+    filename: str
+    url: str
+
+
+class ReactionPayload(NamedTuple):
+    message_id: int
+    emoji: str
+    user_ids: Tuple[int, ...]
+
+
+class MessagePayload(NamedTuple):
+    """the attributes of discord.Message the tables read, so Table.prepare accepts both"""
+    id: int
+    channel: ChannelRef
+    author: AuthorPayload
+    content: str
+    created_at: datetime
+    edited_at: Optional[datetime]
+    attachments: Tuple[AttachmentPayload, ...] = ()
+    reactions: Tuple[ReactionPayload, ...] = ()
+
+
+async def snapshot(message, with_reactions=False):
+    """
+    picklable copy of the message, the users of the reactions
+    need REST calls so they are only fetched for the backfill
+    """
+    author = message.author
+    reactions = ()
+    if with_reactions:
+        reactions = tuple([
+            ReactionPayload(message.id, str(reaction.emoji),
+                            tuple(await reaction.users().map(lambda member: member.id).flatten()))
+            for reaction in message.reactions])
+
+    return MessagePayload(
+        id=message.id,
+        channel=ChannelRef(message.channel.id),
+        author=AuthorPayload(author.id, author.name, str(author.avatar_url), author.created_at),
+        content=message.content,
+        created_at=message.created_at,
+        edited_at=message.edited_at,
+        attachments=tuple(AttachmentPayload(attachment.id, attachment.filename, attachment.url)
+                          for attachment in message.attachments),
+        reactions=reactions)
+
+
+async def as_row(payload):
+    return [payload]
+
+
+def get_collectables(db):
+    """(prepare_fn, statement) pairs of every payload kind, "rows" payloads are prepared already"""
+    return {
+        "backfill": [
+            (db.members.prepare_from_message, "members.insert"),
+            (db.messages.prepare, "messages.insert"),
+            (db.attachments.prepare, "attachments.insert"),
+            (db.reactions.prepare, "reactions.insert"),
+            (db.emojis.prepare, "emojis.insert")
+        ],
+        "message": [
+            (db.members.prepare_from_message, "members.insert"),
+            (db.messages.prepare, "messages.insert")
+        ],
+        "edit": [(db.messages.prepare, "messages.update")],
+        "delete": [(as_row, "messages.soft_delete")]
+    }
+
+
+# the parents are written before the rows referencing them (foreign keys)
+# and the deletes after the inserts of the same rows
+WRITE_ORDER = (
+    "guilds.insert", "categories.insert", "categories.update", "roles.insert", "members.insert",
+    "channels.insert", "channels.update", "messages.insert", "messages.update", "attachments.insert",
+    "reactions.insert", "emojis.insert", "messages.soft_delete", "channels.soft_delete",
+    "categories.soft_delete", "roles.soft_delete", "members.soft_delete", "guilds.soft_delete"
+)
+
+
+class IngestError(Exception):
+    pass
+
+
+class Ingestor:
+    """the worker side, collects the prepared rows and writes them in batches"""
+
+    def __init__(self, db):
+        self.db = db
+        self.collectables = get_collectables(db)
+        self.batches = {statement: [] for statement in WRITE_ORDER}
+        self.size = 0
+
+        # whether a write failed since the last acknowledged flush
+        self.failed = False
+
+        # the backfill emits the author of every message, the same few hundred
+        # users are written again only when their name or avatar changed,
+        # user id -> (name, avatar_url) last written
+        self.seen_users = {}
+
+    @staticmethod
+    def fingerprint(user):
+        return (user.name, user.avatar_url)
+
+    def unseen_users(self, rows):
+        if len(self.seen_users) > SEEN_USERS_LIMIT:
+            self.seen_users.clear()
+
+        unseen = []
+        for row in rows:
+            if self.seen_users.get(row.id) != (fingerprint := self.fingerprint(row)):
+                self.seen_users[row.id] = fingerprint
+                unseen.append(row)
+        return unseen
+
+    def writer(self, statement):
+        table, method = statement.split(".")
+        return getattr(getattr(self.db, table), method)
+
+    def append(self, statement, rows):
+        if statement == "members.insert":
+            rows = self.unseen_users(rows)
+        self.batches[statement].extend(rows)
+        self.size += len(rows)
+
+    async def add(self, kind, payload):
+        if kind == "rows":
+            self.append(*payload)
+            return
+
+        for prepare_fn, statement in self.collectables[kind]:
+            self.append(statement, await prepare_fn(payload))
+
+    async def write(self, statement, rows):
+        """
+        write one batch, when the database rejects it the rows are written one
+        by one so that a bad row only loses itself, returns the rows not written
+        """
+        write = self.writer(statement)
+        try:
+            await write(rows)
+            return []
+        except asyncpg.PostgresError:
+            log.exception("failed to write %d rows with %s, retrying them one by one", len(rows), statement)
+        except Exception:
+            log.exception("failed to write %d rows with %s", len(rows), statement)
+            return rows
+
+        failed = []
+        for row in rows:
+            try:
+                await write([row])
+            except Exception:
+                failed.append(row)
+        log.error("dropped %d of %d rows of %s", len(failed), len(rows), statement)
+        return failed
+
+    async def flush(self):
+        """write the batches, returns whether every row was written"""
+        written = True
+        for statement, rows in self.batches.items():
+            for i in range(0, len(rows), INGEST_BATCH_SIZE):
+                failed = await self.write(statement, rows[i:i + INGEST_BATCH_SIZE])
+                if failed and statement == "members.insert":
+                    # written again when they show up next time
+                    for row in failed:
+                        self.seen_users.pop(row.id, None)
+                written = written and not failed
+            rows.clear()
+
+        self.size = 0
+        self.failed = self.failed or not written
+        return written
+
+    async def acknowledge(self, token, acks):
+        """the flush fails when any write since the last acknowledgement failed"""
+        await self.flush()
+        acks.put((token, not self.failed))
+        self.failed = False
+
+    @staticmethod
+    def receive(inbox):
+        """block for the first item, then take what is already queued"""
+        try:
+            items = [inbox.get(timeout=INGEST_FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+
+        while items[-1] is not STOP and len(items) < INGEST_BATCH_SIZE:
+            try:
+                items.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    async def serve(self, inbox, acks):
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        while True:
+            items = await loop.run_in_executor(None, self.receive, inbox)
+            for item in items:
+                if item is STOP:
+                    await self.flush()
+                    return
+
+                kind, payload = item
+                if kind == "flush":
+                    await self.acknowledge(payload, acks)
+                else:
+                    await self.add(kind, payload)
+
+            if self.size >= INGEST_BATCH_SIZE or loop.time() - last_flush >= INGEST_FLUSH_INTERVAL:
+                await self.flush()
+                last_flush = loop.time()
+
+
+def run_worker(url, inbox, acks):
+    """entry point of the worker process"""
+    from bot.cogs.utils.db import Database
+    from bot.cogs.utils.logging import setup_logging
+
+    setup_logging()
+
+    async def main():
+        db = await Database.create(url)
+        log.info("ingestion worker is ready")
+        try:
+            await Ingestor(db).serve(inbox, acks)
+        finally:
+            await db.pool.close()
+
+    asyncio.run(main())
+    log.info("ingestion worker stopped")
+
+
+class IngestClient:
+    """the gateway side of the queue"""
+
+    def __init__(self, inbox, acks, process=None):
+        self.inbox = inbox
+        self.acks = acks
+        self.process = process
+        self.tokens = itertools.count()
+        self.pending = {}
+        self.reader = None
+
+    def check_alive(self):
+        if self.process is not None and not self.process.is_alive():
+            raise IngestError(f"the ingestion worker is not running (exit code {self.process.exitcode})")
+
+    async def send(self, kind, payload):
+        self.check_alive()
+        try:
+            self.inbox.put_nowait((kind, payload))
+        except queue.Full:
+            # the worker is behind, wait for room without blocking the event loop
+            put = functools.partial(self.inbox.put, (kind, payload), timeout=INGEST_SEND_TIMEOUT)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, put)
+            except queue.Full:
+                raise IngestError(f"the ingestion queue stayed full for {INGEST_SEND_TIMEOUT:.0f}s") from None
+
+    async def write(self, statement, rows):
+        """rows prepared by the gateway, written in the order of WRITE_ORDER"""
+        await self.send("rows", (statement, rows))
+
+    async def flush(self, timeout=INGEST_ACK_TIMEOUT):
+        """
+        wait until the worker wrote everything sent before,
+        raises IngestError when it did not, so the caller can retry later
+        """
+        loop = asyncio.get_running_loop()
+        if self.reader is None:
+            self.reader = loop.create_task(self.read_acks())
+
+        token = next(self.tokens)
+        future = self.pending[token] = loop.create_future()
+        deadline = loop.time() + timeout
+        try:
+            await self.send("flush", token)
+            while not future.done():
+                self.check_alive()
+                if loop.time() >= deadline:
+                    raise IngestError(f"the ingestion worker did not flush within {timeout:.0f}s")
+                await asyncio.wait({future}, timeout=INGEST_ALIVE_INTERVAL)
+        finally:
+            self.pending.pop(token, None)
+
+        if not future.result():
+            raise IngestError("the ingestion worker failed to write some rows")
+
+    async def read_acks(self):
+        loop = asyncio.get_running_loop()
+        while (ack := await loop.run_in_executor(None, self.acks.get)) is not STOP:
+            token, written = ack
+            future = self.pending.pop(token, None)
+            if future is not None and not future.done():
+                future.set_result(written)
+
+
+class IngestWorker:
+    """starts and stops the worker process, the bot talks to it through the client"""
+
+    def __init__(self, url):
+        # spawn, a forked child would inherit the event loop and the sockets of the gateway
+        context = multiprocessing.get_context("spawn")
+        inbox = context.Queue(maxsize=INGEST_QUEUE_SIZE)
+        acks = context.Queue()
+
+        self.process = context.Process(target=run_worker, args=(url, inbox, acks), name="ingest", daemon=True)
+        self.client = IngestClient(inbox, acks, self.process)
+
+    def start(self):
+        self.process.start()
+        log.info("started the ingestion worker (pid %d)", self.process.pid)
+
+    def stop(self):
+        """let the worker write what is queued, then stop it"""
+        if self.process.is_alive():
+            self.client.inbox.put(STOP)
+            self.process.join(INGEST_STOP_TIMEOUT)
+        if self.process.is_alive():
+            log.warning("the ingestion worker did not stop in time, terminating it")
+            self.process.terminate()
+        # wakes up the reader of the acks
+        self.client.acks.put(STOP)
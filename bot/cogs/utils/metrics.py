@@ -0,0 +1,148 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+class Histogram:
+    """
+    cumulative latency histogram with fixed bucket boundaries (in seconds),
+    cheap enough to observe on every event
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        """
+        upper bound of the bucket containing the q-th quantile,
+        the largest finite bucket is returned for the overflow bucket
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                break
+
+        if bound == float("inf"):
+            return self.buckets[-2]
+        return bound
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class Counter:
+    """monotonically increasing value, e.g. rows affected"""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Registry:
+    """
+    named histograms and gauges of the running bot,
+    rendered in the prometheus text format
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.descriptions = {}
+
+    def histogram(self, name, description="", **labels):
+        """get or create the histogram name with the given labels"""
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if (histogram := series.get(key)) is None:
+            histogram = series[key] = Histogram()
+            self.descriptions.setdefault(name, description)
+        return histogram
+
+    def counter(self, name, description="", **labels):
+        """get or create the counter name with the given labels"""
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if (counter := series.get(key)) is None:
+            counter = series[key] = Counter()
+            self.descriptions.setdefault(name, description)
+        return counter
+
+    def add_histogram(self, name, histogram, description="", **labels):
+        """expose an already existing histogram"""
+        self.histograms.setdefault(name, {})[tuple(sorted(labels.items()))] = histogram
+        self.descriptions.setdefault(name, description)
+
+    def gauge(self, name, fn, description=""):
+        """fn is called at render time and returns the current value"""
+        self.gauges[name] = fn
+        self.descriptions.setdefault(name, description)
+
+    @staticmethod
+    def format_labels(labels, **extra):
+        labels = list(labels) + list(extra.items())
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def render(self):
+        lines = []
+
+        for name, fn in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {self.descriptions.get(name, '')}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# HELP {name} {self.descriptions.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, counter in series.items():
+                lines.append(f"{name}{self.format_labels(labels)} {counter.value}")
+
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {self.descriptions.get(name, '')}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f"{name}_bucket{self.format_labels(labels, le=le)} {cumulative}")
+                lines.append(f"{name}_sum{self.format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self.format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def top(self, name, key=lambda histogram: histogram.sum, limit=10):
+        """the labels and histograms of name with the largest key"""
+        series = self.histograms.get(name, {})
+        return sorted(series.items(), key=lambda item: key(item[1]), reverse=True)[:limit]
+
+
+REGISTRY = Registry()
@@ -264,6 +264,46 @@ class Pages:
             await self.match()
 
 
+class KeysetPages(Pages):
+    """Pages that are fetched from the database on demand.
+
+    fetch(last_row, limit) returns the rows following last_row
+    (keyset pagination), first_rows should hold one row more than
+    per_page so that we know whether there is a next page.
+
+    The total number of pages is unknown until the last row is
+    fetched, so the page count is shown with a trailing +.
+    """
+
+    def __init__(self, ctx, *, fetch, first_rows, format_entry, per_page=10, **kwargs):
+        self.fetch = fetch
+        self.format_entry = format_entry
+        self.rows = list(first_rows)
+        self.exhausted = len(self.rows) <= per_page
+        super().__init__(ctx, entries=[format_entry(row) for row in self.rows],
+                         per_page=per_page, show_entry_count=False, **kwargs)
+
+    async def load(self, page):
+        """fetch the rows up to the page and one more to know if a next page exists"""
+        while not self.exhausted and len(self.rows) <= page * self.per_page:
+            rows = await self.fetch(self.rows[-1], self.per_page)
+            self.exhausted = len(rows) < self.per_page
+            self.rows.extend(rows)
+            self.entries.extend(self.format_entry(row) for row in rows)
+
+        self.maximum_pages = -(-len(self.rows) // self.per_page)
+
+    async def show_page(self, page, *, first=False):
+        await self.load(page)
+        await super().show_page(page, first=first)
+
+    def prepare_embed(self, entries, page, *, first=False):
+        super().prepare_embed(entries, page, first=first)
+
+        if not self.exhausted:
+            self.embed.set_footer(text=f'Page {page}/{self.maximum_pages}+')
+
+
 class FieldPages(Pages):
     """Similar to Pages except entries should be a list of
     tuples having (key, value) to show as embed fields instead.
@@ -0,0 +1,62 @@
+import inspect
+from collections import defaultdict
+
+
+CHANNEL_ID_OF = {
+    "message": lambda message: message.channel.id,
+    "reaction_add": lambda reaction, _user: reaction.message.channel.id,
+    "reaction_remove": lambda reaction, _user: reaction.message.channel.id,
+    "raw_reaction_add": lambda payload: payload.channel_id,
+    "raw_reaction_remove": lambda payload: payload.channel_id,
+    "raw_message_edit": lambda payload: payload.channel_id,
+    "raw_message_delete": lambda payload: payload.channel_id,
+}
+
+
+def route(event, channels):
+    """
+    mark a cog method as the handler of event for the given channel ids,
+    the bot then calls it only for events coming from those channels
+    instead of every cog filtering every event on its own
+    """
+    if event not in CHANNEL_ID_OF:
+        raise ValueError(f"event {event} can not be routed by channel")
+
+    def decorator(func):
+        func.__routes__ = getattr(func, "__routes__", []) + [(event, tuple(channels))]
+        return func
+    return decorator
+
+
+class EventRouter:
+    """dispatch table of event -> channel id -> handlers"""
+
+    def __init__(self):
+        self.routes = defaultdict(lambda: defaultdict(list))
+
+    def subscribe(self, event, channel_ids, handler):
+        for channel_id in channel_ids:
+            self.routes[event][channel_id].append(handler)
+
+    def unsubscribe(self, handler):
+        for channels in self.routes.values():
+            for handlers in channels.values():
+                if handler in handlers:
+                    handlers.remove(handler)
+
+    def add_cog(self, cog):
+        for _name, method in inspect.getmembers(cog, inspect.ismethod):
+            for event, channel_ids in getattr(method, "__routes__", ()):
+                self.subscribe(event, channel_ids, method)
+
+    def remove_cog(self, cog):
+        for _name, method in inspect.getmembers(cog, inspect.ismethod):
+            if hasattr(method, "__routes__"):
+                self.unsubscribe(method)
+
+    def handlers(self, event, *args):
+        if (channels := self.routes.get(event)) is None:
+            return ()
+
+        channel_id = CHANNEL_ID_OF[event](*args)
+        return channels.get(channel_id, ())
@@ -0,0 +1,213 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+HIGH = 0
+NORMAL = 5
+LOW = 10
+
+# discord allows 50 requests per second globally, leave most of it to the commands
+RATE_LIMIT = 10.0
+RATE_BURST = 10
+
+JOB_SLOTS = 3
+INTERACTIVE_GRACE = 5.0  # seconds a command pauses the background jobs at most
+
+
+def not_interactive(fn):
+    """
+    the command does not pause the background jobs, for long running
+    commands mostly waiting (e.g. profiling a normally running bot)
+    """
+    fn.__interactive__ = False
+    return fn
+
+
+def is_interactive(command):
+    return getattr(command.callback, "__interactive__", True)
+
+
+class TokenBucket:
+    """shared budget of REST calls for all the background jobs"""
+
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST, *, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """take a token, return how long to wait until it is available"""
+        self.refill()
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+
+class Job:
+    def __init__(self, name, fn, priority):
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.task = None
+        self.cancelled = False
+
+    @property
+    def running(self):
+        return self.task is not None
+
+
+class BackgroundScheduler:
+    """
+    runs the maintenance jobs of the cogs (backups, reordering channels, ...)
+    in the order of their priority, so that the on_ready listeners return
+    immediately and the bot can answer commands
+
+    up to JOB_SLOTS jobs run at once and the LOW jobs (the backfill can run
+    for days) never take the last slot, so the other jobs are not stuck
+    behind them. A job with the same name is never queued twice, the jobs
+    share a budget of REST calls through throttle() and pause while
+    commands are running
+    """
+
+    def __init__(self, budget=None, slots=JOB_SLOTS):
+        self.pending = []
+        self.jobs = {}
+        self.slots = slots
+        self.budget = budget or TokenBucket()
+        self.commands_running = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.changed = asyncio.Event()
+        self.empty = asyncio.Event()
+        self.empty.set()
+        self._counter = itertools.count()
+        self._worker = None
+
+    @property
+    def running(self):
+        return [job for job in self.jobs.values() if job.running]
+
+    @property
+    def current(self):
+        return next(iter(self.running), None)
+
+    def submit(self, name, fn, priority=NORMAL):
+        """queue the coroutine function fn unless it is already queued or running, lower priority runs first"""
+        if (job := self.jobs.get(name)) is not None:
+            log.info("background job %s is already scheduled", name)
+            return job
+
+        log.info("scheduled background job %s (priority %d)", name, priority)
+        job = self.jobs[name] = Job(name, fn, priority)
+        heapq.heappush(self.pending, (priority, next(self._counter), job))
+        self.empty.clear()
+        self.changed.set()
+        return job
+
+    def cancel(self, name):
+        """cancel the queued or running job, returns False if there is no such job"""
+        if (job := self.jobs.pop(name, None)) is None:
+            return False
+
+        job.cancelled = True
+        if job.running:
+            job.task.cancel()
+        self.forget(job)
+        log.info("cancelled background job %s", name)
+        return True
+
+    def forget(self, job):
+        if self.jobs.get(job.name) is job:
+            del self.jobs[job.name]
+        if not self.jobs:
+            self.empty.set()
+        self.changed.set()
+
+    async def join(self):
+        """wait until there are no queued or running jobs"""
+        await self.empty.wait()
+
+    @contextmanager
+    def interactive(self, grace=INTERACTIVE_GRACE):
+        """
+        background jobs wait in throttle() while the block runs, but at most
+        for grace seconds, a paginator waiting for reactions must not starve them
+        """
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.commands_running -= 1
+            if self.commands_running == 0:
+                self.idle.set()
+
+        self.commands_running += 1
+        self.idle.clear()
+        handle = asyncio.get_event_loop().call_later(grace, release)
+        try:
+            yield
+        finally:
+            handle.cancel()
+            release()
+
+    async def throttle(self):
+        """called by the jobs before every REST call"""
+        await self.idle.wait()
+        if (delay := self.budget.delay()) > 0:
+            await asyncio.sleep(delay)
+
+    def start(self, loop):
+        if self._worker is None:
+            self._worker = loop.create_task(self.run())
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        for name in list(self.jobs):
+            self.cancel(name)
+
+    def next_job(self):
+        """the job to start now, if a slot is free for it"""
+        while self.pending and self.pending[0][2].cancelled:
+            heapq.heappop(self.pending)
+        if not self.pending:
+            return None
+
+        running = self.running
+        job = self.pending[0][2]
+        if len(running) >= self.slots:
+            return None
+        if job.priority >= LOW and sum(other.priority >= LOW for other in running) >= self.slots - 1:
+            # the queue is ordered by priority, only LOW jobs are left
+            return None
+        return heapq.heappop(self.pending)[2]
+
+    async def run(self):
+        while True:
+            if (job := self.next_job()) is None:
+                self.changed.clear()
+                await self.changed.wait()
+                continue
+            job.task = asyncio.ensure_future(job.fn())
+            job.task.add_done_callback(lambda task, job=job: self.finished(job, task))
+
+    def finished(self, job, task):
+        if not task.cancelled() and (error := task.exception()) is not None:
+            log.error("background job %s failed", job.name, exc_info=error)
+        self.forget(job)
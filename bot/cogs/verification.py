@@ -6,6 +6,7 @@ from discord.utils import get, find
 from discord.errors import Forbidden
 
 from bot.cogs.utils import constants
+from bot.cogs.utils.router import route
 
 
 log = logging.getLogger(__name__)
@@ -52,6 +53,7 @@ class Verification(commands.Cog):
             log.warning("No verified role presnt in guild %s", guild)
             return
 
+        await self.bot.ensure_chunked(guild)
         with_role = set(filter(lambda member: verified_role in member.roles, guild.members))
         verified = set(await verif_react.users().flatten())
 
@@ -70,23 +72,20 @@ class Verification(commands.Cog):
                 log.warning("missing permissions in guild %s", guild)
 
 
-    @commands.Cog.listener()
+    @route("raw_reaction_add", channels=constants.verification_channels)
     async def on_raw_reaction_add(self, payload):
         await self.on_raw_reaction_update(payload)
 
-    @commands.Cog.listener()
+    @route("raw_reaction_remove", channels=constants.verification_channels)
     async def on_raw_reaction_remove(self, payload):
         await self.on_raw_reaction_update(payload)
 
     async def on_raw_reaction_update(self, payload):
-        if payload.channel_id not in constants.verification_channels:
-            return
-
         if payload.emoji.name.lower() not in ("verification", "verify", "accept"):
             return
 
         guild = get(self.bot.guilds, id=payload.guild_id)
-        member = get(guild.members, id=payload.user_id)
+        member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
 
         if not guild.me.guild_permissions.manage_roles:
             log.warning("I don't have manage_roles permissions in %s", guild)
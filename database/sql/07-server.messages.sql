@@ -1,3 +1,21 @@
+-- Extension: unaccent
+
+-- DROP EXTENSION unaccent;
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+-- Text Search Configuration: server.czech_english
+
+-- DROP TEXT SEARCH CONFIGURATION server.czech_english;
+
+-- postgres ships no czech dictionary, so czech words are matched without
+-- diacritics (unaccent) and english words are stemmed on top of that
+CREATE TEXT SEARCH CONFIGURATION server.czech_english (
+    COPY = pg_catalog.english
+);
+
+ALTER TEXT SEARCH CONFIGURATION server.czech_english
+    ALTER MAPPING FOR word, hword, hword_part
+    WITH unaccent, english_stem;
 -- Table: server.messages
 
 -- DROP TABLE server.messages;
@@ -11,20 +29,17 @@ CREATE TABLE server.messages
     created_at timestamp without time zone NOT NULL DEFAULT now(),
     edited_at timestamp without time zone,
     deleted_at timestamp without time zone,
-    CONSTRAINT messages_pkey PRIMARY KEY (id),
+    content_tsv tsvector,
+    CONSTRAINT messages_pkey PRIMARY KEY (id, created_at),
     CONSTRAINT messages_fkey_channel FOREIGN KEY (channel_id)
         REFERENCES server.channels (id) MATCH SIMPLE
         ON UPDATE NO ACTION
-        ON DELETE NO ACTION
-        NOT VALID,
+        ON DELETE NO ACTION,
     CONSTRAINT messages_fkey_user FOREIGN KEY (author_id)
         REFERENCES server.users (id) MATCH SIMPLE
         ON UPDATE NO ACTION
         ON DELETE NO ACTION
-        NOT VALID
-)
-
-TABLESPACE pg_default;
+) PARTITION BY RANGE (created_at);
 
 ALTER TABLE server.messages
     OWNER to masaryk;
@@ -34,13 +49,79 @@ ALTER TABLE server.messages
 
 CREATE INDEX fki_messages_fkey_channel
     ON server.messages USING btree
-    (channel_id ASC NULLS LAST)
-    TABLESPACE pg_default;
+    (channel_id ASC NULLS LAST);
 -- Index: fki_messages_fkey_user
 
 -- DROP INDEX server.fki_messages_fkey_user;
 
 CREATE INDEX fki_messages_fkey_user
     ON server.messages USING btree
-    (author_id ASC NULLS LAST)
-    TABLESPACE pg_default;
+    (author_id ASC NULLS LAST);
+-- Index: messages_idx_created_at
+
+-- DROP INDEX server.messages_idx_created_at;
+
+CREATE INDEX messages_idx_created_at
+    ON server.messages USING brin
+    (created_at);
+-- Index: messages_idx_content_tsv
+
+-- DROP INDEX server.messages_idx_content_tsv;
+
+CREATE INDEX messages_idx_content_tsv
+    ON server.messages USING gin
+    (content_tsv);
+-- FUNCTION: server.ensure_messages_partition(timestamp without time zone)
+
+-- DROP FUNCTION server.ensure_messages_partition(timestamp without time zone);
+
+CREATE OR REPLACE FUNCTION server.ensure_messages_partition(
+    month timestamp without time zone)
+    RETURNS void
+    LANGUAGE 'plpgsql'
+AS $BODY$
+DECLARE
+    from_date date := date_trunc('month', month);
+    to_date date := date_trunc('month', month) + interval '1 month';
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS server.%I PARTITION OF server.messages FOR VALUES FROM (%L) TO (%L)',
+                   'messages_' || to_char(from_date, 'YYYY_MM'), from_date, to_date);
+EXCEPTION
+    -- another connection created the same partition concurrently
+    WHEN duplicate_table THEN NULL;
+END;
+$BODY$;
+
+ALTER FUNCTION server.ensure_messages_partition(timestamp without time zone)
+    OWNER TO masaryk;
+-- FUNCTION: server.detach_messages_partitions(timestamp without time zone)
+
+-- DROP FUNCTION server.detach_messages_partitions(timestamp without time zone);
+
+CREATE OR REPLACE FUNCTION server.detach_messages_partitions(
+    older_than timestamp without time zone)
+    RETURNS SETOF text
+    LANGUAGE 'plpgsql'
+AS $BODY$
+DECLARE
+    partition text;
+BEGIN
+    FOR partition IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class AS child ON pg_inherits.inhrelid = child.oid
+        JOIN pg_namespace AS nsp ON parent.relnamespace = nsp.oid
+        WHERE nsp.nspname = 'server' AND
+              parent.relname = 'messages' AND
+              to_date(substring(child.relname FROM 'messages_(\d{4}_\d{2})$'), 'YYYY_MM') + interval '1 month' <= older_than
+        ORDER BY child.relname
+    LOOP
+        EXECUTE format('ALTER TABLE server.messages DETACH PARTITION server.%I', partition);
+        RETURN NEXT partition;
+    END LOOP;
+END;
+$BODY$;
+
+ALTER FUNCTION server.detach_messages_partitions(timestamp without time zone)
+    OWNER TO masaryk;
@@ -8,11 +8,7 @@ CREATE TABLE server.attachments
     id bigint NOT NULL,
     filename text COLLATE pg_catalog."default",
     url text COLLATE pg_catalog."default",
-    CONSTRAINT attachments_pkey PRIMARY KEY (id),
-    CONSTRAINT attachments_fkey_message FOREIGN KEY (message_id)
-        REFERENCES server.messages (id) MATCH SIMPLE
-        ON UPDATE NO ACTION
-        ON DELETE NO ACTION
+    CONSTRAINT attachments_pkey PRIMARY KEY (id)
 )
 
 TABLESPACE pg_default;
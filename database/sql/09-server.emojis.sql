@@ -6,11 +6,7 @@ CREATE TABLE server.emojis
 (
     message_id bigint NOT NULL,
     name text COLLATE pg_catalog."default",
-    count integer,
-    CONSTRAINT emojis_fkey_message FOREIGN KEY (message_id)
-        REFERENCES server.messages (id) MATCH SIMPLE
-        ON UPDATE NO ACTION
-        ON DELETE NO ACTION
+    count integer
 )
 
 TABLESPACE pg_default;
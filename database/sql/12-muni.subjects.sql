@@ -1,3 +1,7 @@
+-- Extension: pg_trgm
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Table: muni.subjects
 
 -- DROP TABLE muni.subjects;
@@ -18,4 +22,20 @@ CREATE TABLE muni.subjects
 TABLESPACE pg_default;
 
 ALTER TABLE muni.subjects
-    OWNER to masaryk;
\ No newline at end of file
+    OWNER to masaryk;
+-- Index: subjects_idx_code_trgm
+
+-- DROP INDEX muni.subjects_idx_code_trgm;
+
+CREATE INDEX subjects_idx_code_trgm
+    ON muni.subjects USING gin
+    (LOWER(code) gin_trgm_ops)
+    TABLESPACE pg_default;
+-- Index: subjects_idx_name_trgm
+
+-- DROP INDEX muni.subjects_idx_name_trgm;
+
+CREATE INDEX subjects_idx_name_trgm
+    ON muni.subjects USING gin
+    (LOWER(name) gin_trgm_ops)
+    TABLESPACE pg_default;
@@ -0,0 +1,21 @@
+-- Table: cogs.export
+
+-- DROP TABLE cogs.export;
+
+CREATE TABLE cogs.export
+(
+    guild_id bigint NOT NULL,
+    source character varying(32) COLLATE pg_catalog."default" NOT NULL,
+    exported_until timestamp without time zone NOT NULL,
+    exported_at timestamp without time zone NOT NULL DEFAULT now(),
+    CONSTRAINT export_pkey PRIMARY KEY (guild_id, source),
+    CONSTRAINT export_fkey_guild FOREIGN KEY (guild_id)
+        REFERENCES server.guilds (id) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE NO ACTION
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE cogs.export
+    OWNER to masaryk;
@@ -0,0 +1,43 @@
+-- Table: cogs.activity
+
+-- DROP TABLE cogs.activity;
+
+CREATE TABLE cogs.activity
+(
+    guild_id bigint NOT NULL,
+    channel_id bigint NOT NULL,
+    hour timestamp without time zone NOT NULL,
+    messages_sent integer NOT NULL,
+    CONSTRAINT activity_pkey PRIMARY KEY (channel_id, hour)
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE cogs.activity
+    OWNER to masaryk;
+-- Index: activity_idx_guild_hour
+
+-- DROP INDEX cogs.activity_idx_guild_hour;
+
+CREATE INDEX activity_idx_guild_hour
+    ON cogs.activity USING btree
+    (guild_id ASC NULLS LAST, hour ASC NULLS LAST)
+    TABLESPACE pg_default;
+
+
+-- Table: cogs.activity_users
+
+-- DROP TABLE cogs.activity_users;
+
+CREATE TABLE cogs.activity_users
+(
+    guild_id bigint NOT NULL,
+    day timestamp without time zone NOT NULL,
+    active_users integer NOT NULL,
+    CONSTRAINT activity_users_pkey PRIMARY KEY (guild_id, day)
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE cogs.activity_users
+    OWNER to masaryk;
@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bot.cogs.activity import Activity, ROLLUP_LOOKBACK, hour_of_week, daily, moving_average
+from bot.cogs.utils import scheduler
+
+
+def epoch(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+class ActivityStatisticsTests(unittest.TestCase):
+    def test_hour_of_week_fills_missing_slots(self):
+        weekdays, hours, counts = np.array([0, 6]), np.array([8, 23]), np.array([3, 5])
+
+        matrix = hour_of_week(weekdays, hours, counts)
+
+        self.assertEqual(matrix.shape, (7, 24))
+        self.assertEqual(matrix[0, 8], 3)
+        self.assertEqual(matrix[6, 23], 5)
+        self.assertEqual(matrix.sum(), 8)
+
+    def test_daily_fills_missing_days_and_drops_out_of_range(self):
+        start = epoch(2021, 3, 1)
+        timestamps = np.array([epoch(2021, 2, 28), epoch(2021, 3, 1, 10), epoch(2021, 3, 1, 12), epoch(2021, 3, 3)])
+        counts = np.array([100, 1, 2, 4])
+
+        self.assertEqual(daily(timestamps, counts, start, 4).tolist(), [3, 0, 4, 0])
+
+    def test_moving_average(self):
+        result = moving_average(np.array([1, 2, 3, 4]), window=2)
+
+        self.assertTrue(np.isnan(result[0]))
+        self.assertEqual(result[1:].tolist(), [1.5, 2.5, 3.5])
+
+    def test_render_series(self):
+        cog = Activity.__new__(Activity)
+        image = cog.render_series({"#general": np.arange(10)}, datetime(2021, 3, 1), "title")
+
+        self.assertEqual(image.read(4), b"\x89PNG")
+
+
+class ActivityRollupTests(unittest.TestCase):
+    def test_refresh_only_recounts_the_recent_hours(self):
+        cog = Activity.__new__(Activity)
+        cog.bot = mock.Mock()
+        cog.bot.db.activity.rollup = mock.AsyncMock()
+
+        asyncio.run(cog.refresh.coro(cog))
+
+        name, job = cog.bot.scheduler.submit.call_args.args
+        self.assertEqual(cog.bot.scheduler.submit.call_args.kwargs, {"priority": scheduler.LOW})
+        asyncio.run(job())
+        from_date, to_date = cog.bot.db.activity.rollup.await_args.args
+        self.assertEqual(to_date - from_date, ROLLUP_LOOKBACK)
@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime
+
+from bot.cogs.export import months_between, archived_until
+
+
+class MonthsBetweenTests(unittest.TestCase):
+    def test_months_up_to_the_current_one(self):
+        months = list(months_between(datetime(2020, 11, 17), datetime(2021, 2, 3)))
+
+        self.assertEqual(months, [datetime(2020, 11, 1), datetime(2020, 12, 1), datetime(2021, 1, 1)])
+
+    def test_nothing_to_export_within_the_same_month(self):
+        self.assertEqual(list(months_between(datetime(2021, 2, 1), datetime(2021, 2, 28))), [])
+
+
+class ArchivedUntilTests(unittest.TestCase):
+    @staticmethod
+    def process(from_date, to_date, finished_at=datetime(2021, 3, 1)):
+        return {"from_date": from_date, "to_date": to_date, "finished_at": finished_at}
+
+    def test_nothing_is_archived_before_the_first_week_finished(self):
+        self.assertIsNone(archived_until([]))
+        self.assertIsNone(archived_until([self.process(datetime(2020, 1, 1), datetime(2020, 1, 8), None)]))
+
+    def test_archive_ends_with_the_finished_weeks(self):
+        processes = [self.process(datetime(2020, 1, 1), datetime(2021, 1, 20))]
+
+        self.assertEqual(archived_until(processes), datetime(2021, 1, 20))
+        self.assertEqual(list(months_between(datetime(2020, 12, 1), archived_until(processes))), [datetime(2020, 12, 1)])
+
+    def test_archive_ends_before_a_failed_week(self):
+        processes = [self.process(datetime(2020, 1, 1), datetime(2021, 1, 20)),
+                     self.process(datetime(2020, 11, 10), datetime(2020, 11, 17), None)]
+
+        self.assertEqual(archived_until(processes), datetime(2020, 11, 10))
@@ -0,0 +1,32 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from discord import Status
+
+from bot.cogs.info import Info
+
+
+def member(status, guild_id=1):
+    return mock.Mock(status=status, guild=mock.Mock(id=guild_id))
+
+
+class StatusCounterTests(unittest.TestCase):
+    def setUp(self):
+        self.cog = Info(mock.Mock(emojis=[]))
+        self.guild = mock.Mock(id=1, members=[member(Status.online), member(Status.offline), member(Status.offline)])
+
+    def test_status_is_counted_once(self):
+        self.assertEqual(self.cog.get_status(self.guild), {"online": 1, "offline": 2})
+
+        self.guild.members = []
+        self.assertEqual(self.cog.get_status(self.guild)["offline"], 2)
+
+    def test_member_events_update_the_counts(self):
+        self.cog.get_status(self.guild)
+
+        asyncio.run(self.cog.on_member_join(member(Status.idle)))
+        asyncio.run(self.cog.on_member_update(member(Status.offline), member(Status.online)))
+        asyncio.run(self.cog.on_member_remove(member(Status.online)))
+
+        self.assertEqual(self.cog.get_status(self.guild), {"online": 1, "offline": 1, "idle": 1})
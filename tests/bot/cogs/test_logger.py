@@ -1,10 +1,10 @@
+import asyncio
 import unittest
 from unittest import mock
 
-from datetime import datetime
-
 import bot.cogs.logger as logger
-from tests.helpers import MockBot, MockGuild, MockConnection, unwrap
+from bot.cogs.utils import scheduler
+from tests.helpers import MockBot, MockGuild
 
 class LoggerTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
@@ -14,14 +14,50 @@ class LoggerTests(unittest.IsolatedAsyncioTestCase):
             self.cog = logger.Logger(bot=self.bot)
 
     async def test_backup_guilds(self):
-        self.bot.guilds = [
+        guilds = [
             MockGuild(id=0, name="first"),
             MockGuild(id=1, name="second"),
             MockGuild(id=2, name="third")
         ]
-        backup_guilds = unwrap(self.cog.backup_guilds)
+        self.bot.db.guilds.prepare = mock.AsyncMock(side_effect=lambda guilds: [(guild.id,) for guild in guilds])
+        self.bot.ingest.write = mock.AsyncMock()
+
+        await self.cog.backup_guilds(guilds)
+
+        self.bot.ingest.write.assert_awaited_once_with("guilds.insert", [(0,), (1,), (2,)])
+
+    async def test_backup_covers_only_the_guilds_of_the_shard(self):
+        guilds = [MockGuild(id=0, shard_id=0), MockGuild(id=1, shard_id=1), MockGuild(id=2, shard_id=0)]
+        self.bot.shard_guilds = lambda shard_id: [guild for guild in guilds if guild.shard_id == shard_id]
+
+        steps = ("backup_guilds", "backup_categories", "backup_roles", "backup_members",
+                 "backup_channels", "backup_messages")
+        with mock.patch.multiple(self.cog, **{step: mock.AsyncMock() for step in steps}):
+            await self.cog.backup(shard_id=0)
+
+            self.cog.backup_guilds.assert_awaited_once_with([guilds[0], guilds[2]])
+            self.assertEqual([call.args[0] for call in self.cog.backup_messages.await_args_list],
+                             [guilds[0], guilds[2]])
+
+    async def test_shard_and_manual_backups_of_a_shard_run_once(self):
+        self.bot.scheduler = scheduler.BackgroundScheduler()
+        self.bot.shards = {0: mock.Mock(), 1: mock.Mock()}
+        release = asyncio.Event()
+        started = []
+
+        async def backup(shard_id=None):
+            started.append(shard_id)
+            await release.wait()
 
-        conn = MockConnection()
-        await backup_guilds(self.cog, conn)
-        print(conn.executemany.call_args)
+        ctx = mock.Mock(send_success=mock.AsyncMock())
+        with mock.patch.object(self.cog, "backup", backup):
+            await self.cog.on_shard_ready(0)
+            self.bot.scheduler.start(asyncio.get_running_loop())
+            await asyncio.sleep(0)
+            await self.cog._backup.callback(self.cog, ctx)
+            await asyncio.sleep(0.01)
+            release.set()
+            await self.bot.scheduler.join()
+            self.bot.scheduler.stop()
 
+        self.assertEqual(sorted(started), [0, 1])
@@ -0,0 +1,67 @@
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.cogs import paste
+
+
+class PasteTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with mock.patch.object(paste.Paste, "start_server", mock.Mock()):
+            self.cog = paste.Paste(mock.Mock())
+        self.cog.bot.loop = asyncio.get_running_loop()
+        self.cog.store = paste.PasteStore(directory.name)
+
+        self.client = TestClient(TestServer(self.cog.create_app()))
+        await self.client.start_server()
+        self.addAsyncCleanup(self.client.close)
+
+    def key_of(self, url):
+        self.assertTrue(url.startswith(paste.PASTE_URL + "/"))
+        return url.rsplit("/", 1)[1]
+
+    async def test_created_paste_is_fetched_back(self):
+        key = self.key_of(self.cog.upload("print('ahoj')"))
+
+        response = await self.client.get(f"/{key}", headers={"Accept-Encoding": "identity"})
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.text(), "print('ahoj')")
+        self.assertIn(key, self.cog.stored)
+
+    async def test_gzip_is_served_as_stored(self):
+        key = self.key_of(self.cog.upload("x" * 1000))
+        await self.cog.pending[key]
+
+        response = await self.client.get(f"/{key}", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(await response.text(), "x" * 1000)
+
+    async def test_same_content_is_stored_once(self):
+        self.assertEqual(self.cog.upload("same"), self.cog.upload("same"))
+        self.assertEqual(len(self.cog.pending), 1)
+
+    async def test_unknown_and_invalid_keys_are_not_found(self):
+        for key in ("0" * 64, "../etc/passwd", "abc"):
+            with self.subTest(key=key):
+                response = await self.client.get(f"/{key}")
+                self.assertEqual(response.status, 404)
+
+
+class PasteServerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_failing_bind_is_logged(self):
+        with mock.patch.object(paste.Paste, "start_server", mock.Mock()):
+            cog = paste.Paste(mock.Mock())
+
+        with mock.patch.object(paste.web.TCPSite, "start", mock.AsyncMock(side_effect=OSError("in use"))), \
+                self.assertLogs(paste.log, "ERROR"):
+            await cog.start_server()
+
+        self.assertIsNone(cog.runner)
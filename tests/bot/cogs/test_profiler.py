@@ -0,0 +1,49 @@
+import inspect
+import unittest
+from types import SimpleNamespace
+
+from bot.cogs.profiler import Profiler, SamplingProfiler
+from bot.cogs.utils import scheduler
+
+
+def code(name, filename="bot.py", line=1, coroutine=False):
+    return SimpleNamespace(co_name=name, co_qualname=name, co_filename=f"/app/{filename}", co_firstlineno=line,
+                           co_flags=inspect.CO_COROUTINE if coroutine else 0)
+
+
+def frames(*codes):
+    """frame chain of the codes, outermost first, returns the innermost frame"""
+    frame = None
+    for f_code in codes:
+        frame = SimpleNamespace(f_code=f_code, f_back=frame)
+    return frame
+
+
+class SamplingProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.profiler = SamplingProfiler(thread_id=0)
+
+    def test_stacks_are_collapsed_outermost_first(self):
+        stack = frames(code("run_forever", "base_events.py", 10), code("_run", "events.py", 20),
+                       code("Logger.backup", "logger.py", 30, coroutine=True), code("prepare", "db.py", 40))
+
+        self.profiler.sample(stack)
+        self.profiler.sample(stack)
+
+        self.assertEqual(self.profiler.collapsed(),
+                         "run_forever (base_events.py:10);_run (events.py:20);" +
+                         "Logger.backup (logger.py:30);prepare (db.py:40) 2")
+        self.assertEqual(self.profiler.samples, 2)
+
+    def test_sample_is_attributed_to_the_outermost_coroutine(self):
+        self.profiler.sample(frames(code("_run"), code("Logger.backup", coroutine=True),
+                                    code("Messages.insert", coroutine=True), code("executemany")))
+        self.profiler.sample(frames(code("run_forever"), code("select")))
+
+        self.assertEqual(self.profiler.coroutines, {"Logger.backup": 1, "<idle>": 1})
+
+
+class ProfilerCommandTests(unittest.TestCase):
+    def test_cpu_profile_does_not_pause_the_background_jobs(self):
+        self.assertFalse(scheduler.is_interactive(Profiler.profile_cpu))
+        self.assertTrue(scheduler.is_interactive(Profiler.profile_memory))
@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+from datetime import datetime
+
+from discord.ext import commands
+
+from bot.cogs.search import Search
+
+
+class ParseDateFiltersTests(unittest.TestCase):
+    def test_filters_are_removed_from_the_query(self):
+        query, after, before = Search.parse_date_filters("after:2020-09-01 zkouska before:2021-02-01 ib111")
+
+        self.assertEqual(query, "zkouska  ib111")
+        self.assertEqual(after, datetime(2020, 9, 1))
+        self.assertEqual(before, datetime(2021, 2, 1))
+
+    def test_invalid_date_is_rejected(self):
+        with self.assertRaises(commands.BadArgument):
+            Search.parse_date_filters("after:2020-13-01 zkouska")
+
+
+def channel(id, readable=True):
+    return mock.Mock(id=id, permissions_for=lambda member: mock.Mock(read_messages=readable))
+
+
+class SearchScopeTests(unittest.TestCase):
+    def setUp(self):
+        self.staff, self.general = channel(1, readable=False), channel(2)
+        self.member = mock.Mock(id=42)
+        self.guild = mock.Mock(text_channels=[self.staff, self.general])
+        self.guild.get_channel = {1: self.staff, 2: self.general}.get
+        self.guild.get_member = {42: self.member}.get
+
+    def test_only_readable_channels_are_searched(self):
+        self.assertEqual(Search.readable_channel_ids(self.guild, self.member), [2])
+        self.assertEqual(Search.readable_channel_ids(self.guild, self.member, self.staff), [])
+
+    def test_mentions_are_filters(self):
+        query, found_channel, author = Search.parse_mention_filters(self.guild, "<#2> <@!42> zkouska ib111")
+
+        self.assertEqual((query, found_channel, author), ("zkouska ib111", self.general, self.member))
+
+    def test_names_stay_in_the_query(self):
+        self.assertEqual(Search.parse_mention_filters(self.guild, "general zkouska"), ("general zkouska", None, None))
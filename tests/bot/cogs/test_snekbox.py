@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+
+from bot.cogs.snekbox import EvalScheduler, EvalQueueFull
+
+
+class EvalSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_is_capped(self):
+        scheduler = EvalScheduler(concurrency=2, max_queued=10)
+        running = []
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            running.append(None)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(*(scheduler.run(user_id, job) for user_id in range(6)))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.waiting, 0)
+        self.assertEqual(scheduler.run_latency.count, 6)
+
+    async def test_queue_is_served_round_robin(self):
+        scheduler = EvalScheduler(concurrency=1, max_queued=10)
+        release = asyncio.Event()
+        order = []
+
+        async def blocking_job():
+            await release.wait()
+
+        def job(user_id):
+            async def _job():
+                order.append(user_id)
+            return _job
+
+        blocker = asyncio.create_task(scheduler.run(0, blocking_job))
+        await asyncio.sleep(0)
+
+        waiters = [asyncio.create_task(scheduler.run(user_id, job(user_id))) for user_id in (1, 1, 1, 2)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *waiters)
+
+        self.assertEqual(order, [1, 2, 1, 1])
+
+    async def test_full_queue_is_rejected(self):
+        scheduler = EvalScheduler(concurrency=1, max_queued=1)
+        release = asyncio.Event()
+
+        blocker = asyncio.create_task(scheduler.run(0, release.wait))
+        queued = asyncio.create_task(scheduler.run(1, release.wait))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(EvalQueueFull):
+            await scheduler.run(2, release.wait)
+
+        release.set()
+        await asyncio.gather(blocker, queued)
+
+    async def test_queue_position_is_reported(self):
+        scheduler = EvalScheduler(concurrency=1, max_queued=10)
+        release = asyncio.Event()
+        positions = []
+
+        async def on_queued(position):
+            positions.append(position)
+
+        blocker = asyncio.create_task(scheduler.run(0, release.wait))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(scheduler.run(user_id, release.wait, on_queued=on_queued))
+                   for user_id in (1, 2)]
+        await asyncio.sleep(0)
+
+        self.assertEqual(positions, [1, 2])
+        release.set()
+        await asyncio.gather(blocker, *waiters)
+
+    async def test_failing_on_queued_does_not_lose_the_slot(self):
+        scheduler = EvalScheduler(concurrency=1, max_queued=10)
+        release = asyncio.Event()
+
+        async def on_queued(position):
+            raise RuntimeError("cannot send to the channel")
+
+        blocker = asyncio.create_task(scheduler.run(0, release.wait))
+        await asyncio.sleep(0)
+        with self.assertRaises(RuntimeError):
+            await scheduler.run(1, release.wait, on_queued=on_queued)
+
+        self.assertEqual(scheduler.waiting, 0)
+        release.set()
+        await blocker
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(await asyncio.wait_for(scheduler.run(2, lambda: asyncio.sleep(0, "ran")), 1), "ran")
@@ -0,0 +1,16 @@
+import unittest
+from unittest import mock
+
+from bot.cogs import stats
+
+
+class MetricsServerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_failing_bind_is_logged(self):
+        with mock.patch.object(stats.Stats, "start_server", mock.Mock()):
+            cog = stats.Stats(mock.Mock())
+
+        with mock.patch.object(stats.web.TCPSite, "start", mock.AsyncMock(side_effect=OSError("in use"))), \
+                self.assertLogs(stats.log, "ERROR"):
+            await cog.start_server()
+
+        self.assertIsNone(cog.runner)
@@ -0,0 +1,181 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from discord import TextChannel, CategoryChannel
+
+from bot.cogs.subject import GuildChannelIndex, Subject
+from bot.cogs.utils import db
+
+
+def channel(spec, id, name, category_id):
+    channel = mock.Mock(spec=spec, id=id, category_id=category_id)
+    # name is an argument of the mock itself
+    channel.name = name
+    return channel
+
+
+def text_channel(id, name, category_id=None):
+    return channel(TextChannel, id, name, category_id)
+
+
+def category(id, name):
+    return channel(CategoryChannel, id, name, None)
+
+
+class GuildChannelIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.category = category(1, "FI 1")
+        self.channel = text_channel(10, "ib111-zaklady-programovani", category_id=1)
+        self.index = GuildChannelIndex(mock.Mock(channels=[self.category, self.channel]))
+
+    def test_channel_added_twice_is_counted_once(self):
+        created = text_channel(11, "ib002-algoritmy", category_id=1)
+        # by the command creating the channel and by the gateway event
+        self.index.add(created)
+        self.index.add(created)
+        self.index.add(self.category)
+
+        self.assertEqual(self.index.free_slots(self.category), GuildChannelIndex.CATEGORY_LIMIT - 2)
+        self.assertIs(self.index.get_category("FI 1"), self.category)
+
+    def test_removing_one_of_two_channels_with_the_same_code(self):
+        other = text_channel(11, "ib111-cviceni", category_id=1)
+        self.index.add(other)
+
+        self.index.remove(self.channel)
+
+        self.assertIs(self.index.find_subject_channel("FI", "IB111"), other)
+        self.assertEqual(self.index.free_slots(self.category), GuildChannelIndex.CATEGORY_LIMIT - 1)
+
+    def test_renamed_channel_is_removed_under_its_old_name(self):
+        self.channel.name = "ib113-python"
+        self.index.remove(self.channel)
+        self.index.add(self.channel)
+
+        self.assertIsNone(self.index.get_channel("ib111-zaklady-programovani"))
+        self.assertIsNone(self.index.find_subject_channel("FI", "ib111"))
+        self.assertIs(self.index.find_subject_channel("FI", "ib113"), self.channel)
+
+    def test_removing_unknown_channel_does_nothing(self):
+        self.index.remove(text_channel(99, "ib999", category_id=1))
+
+        self.assertEqual(self.index.free_slots(self.category), GuildChannelIndex.CATEGORY_LIMIT - 1)
+
+    def test_find_by_prefix(self):
+        self.assertIs(self.index.find_by_prefix("IB1"), self.channel)
+        self.assertIsNone(self.index.find_by_prefix("pb"))
+
+    def test_removing_one_of_two_channels_with_the_same_name(self):
+        other = text_channel(11, "ib111-zaklady-programovani", category_id=1)
+        self.index.add(other)
+
+        self.index.remove(self.channel)
+
+        self.assertIs(self.index.get_channel("ib111-zaklady-programovani"), other)
+
+
+class SubjectChannelIndexTests(unittest.TestCase):
+    def test_guilds_of_a_reconnected_shard_are_reindexed(self):
+        bot = mock.Mock()
+        cog = Subject(bot)
+        first, second = mock.Mock(id=1, channels=[]), mock.Mock(id=2, channels=[])
+        stale = cog.index[first]
+        cog.index[second]
+        bot.shard_guilds.return_value = [first]
+
+        asyncio.run(cog.on_shard_ready(0))
+
+        self.assertEqual(set(cog.index.guilds), {2})
+        self.assertIsNot(cog.index[first], stale)
+
+
+async def stream(*lines, chunk_size=7):
+    """the lines as the http response sends them, in chunks not aligned to the lines"""
+    data = "\n".join(lines).encode()
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+class CatalogReaderTests(unittest.TestCase):
+    def read(self, fmt, *lines):
+        async def main():
+            return [row async for row in Subject.read_catalog(stream(*lines), fmt, rejected)]
+
+        rejected = []
+        return asyncio.run(main()), rejected
+
+    def test_invalid_csv_lines_are_reported_and_skipped(self):
+        rows, rejected = self.read("csv",
+                                   "faculty,code,name,url,terms",
+                                   "FI,IB111,Základy programování,https://is.muni.cz/IB111,podzim 2021;jaro 2022",
+                                   "FI,IB002,too few columns",
+                                   ",IB000,no faculty,https://is.muni.cz/IB000,",
+                                   "FI,MB151,Lineární modely,https://is.muni.cz/MB151,")
+
+        self.assertEqual(rows, [
+            ("FI", "IB111", "Základy programování", "https://is.muni.cz/IB111", ["podzim 2021", "jaro 2022"]),
+            ("FI", "MB151", "Lineární modely", "https://is.muni.cz/MB151", [])])
+        self.assertEqual([line_number for line_number, _error in rejected], [3, 4])
+
+    def test_overlong_line_is_rejected_without_aborting_the_import(self):
+        with mock.patch("bot.cogs.subject.MAX_CATALOG_LINE", 40):
+            rows, rejected = self.read("csv",
+                                       "FI,IB111,n,u,",
+                                       "FI,IB002," + "x" * 100 + ",u,",
+                                       "FI,MB151,n,u,")
+
+        self.assertEqual([code for _faculty, code, *_ in rows], ["IB111", "MB151"])
+        self.assertEqual([line_number for line_number, _error in rejected], [2])
+
+    def test_invalid_json_lines_are_reported_and_skipped(self):
+        rows, rejected = self.read("jsonl",
+                                   '{"faculty": "FI", "code": "IB111", "name": "n", "url": "u", "terms": []}',
+                                   '{"faculty": "FI", "code": "IB002"',
+                                   '{"faculty": "FI", "code": "IB000", "name": "n", "url": "u", "terms": "jaro"}')
+
+        self.assertEqual(rows, [("FI", "IB111", "n", "u", [])])
+        self.assertEqual([line_number for line_number, _error in rejected], [2, 3])
+
+
+class ImportCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.staged = []
+        self.conn = mock.Mock()
+        self.conn.execute = mock.AsyncMock(return_value="UPDATE 2")
+        self.conn.fetchrow = mock.AsyncMock(return_value={"inserted": 1, "updated": 1})
+        self.conn.copy_records_to_table = mock.AsyncMock(side_effect=self.copy)
+        self.conn.transaction = mock.MagicMock()
+
+        pool = mock.Mock()
+        pool.acquire.return_value.__aenter__ = mock.AsyncMock(return_value=self.conn)
+        pool.acquire.return_value.__aexit__ = mock.AsyncMock(return_value=False)
+        self.subjects = db.Subjects(pool)
+
+    async def copy(self, table, records, columns):
+        self.assertEqual(table, "subjects_staging")
+        self.staged.extend([record async for record in records])
+
+    def statements(self):
+        return [" ".join(call.args[0].split()) for call in self.conn.execute.await_args_list]
+
+    def test_staged_rows_are_upserted_and_missing_subjects_soft_deleted(self):
+        records = Subject.read_catalog(stream("FI,IB111,n,u,", "FI,MB151,n,u,"), "csv", [])
+
+        result = asyncio.run(self.subjects.import_catalog(records))
+
+        self.assertEqual(result, (1, 1, 2))
+        self.assertEqual([code for _faculty, code, *_ in self.staged], ["IB111", "MB151"])
+        self.assertIn("INSERT INTO muni.subjects", self.conn.fetchrow.await_args.args[0])
+        self.assertTrue(self.statements()[0].startswith("CREATE TEMPORARY TABLE subjects_staging"))
+        self.assertTrue(self.statements()[1].startswith("UPDATE muni.subjects AS s SET deleted_at = NOW()"))
+
+    def test_nothing_is_soft_deleted_when_lines_were_rejected(self):
+        rejected = []
+        records = Subject.read_catalog(stream("FI,IB111,n,u,", "FI,broken"), "csv", rejected)
+
+        result = asyncio.run(self.subjects.import_catalog(records, rejected))
+
+        self.assertEqual(result, (1, 1, 0))
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(len(self.statements()), 1)
@@ -0,0 +1,55 @@
+import unittest
+
+from bot.cogs.utils.cache import LRUCache, content_key, has_nocache_marker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(max_bytes=10, ttl=60, clock=self.clock)
+
+    def test_get_returns_stored_value(self):
+        self.cache.put("a", "value", size=5)
+
+        self.assertEqual(self.cache.get("a"), "value")
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.put("a", "value", size=5)
+        self.clock.now = 61
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_least_recently_used_is_evicted_when_over_bytes(self):
+        self.cache.put("a", "a", size=4)
+        self.cache.put("b", "b", size=4)
+        self.cache.get("a")
+        self.cache.put("c", "c", size=4)
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), "a")
+        self.assertEqual(self.cache.get("c"), "c")
+        self.assertEqual(self.cache.size, 8)
+
+    def test_oversized_values_are_not_stored(self):
+        self.cache.put("a", "a", size=11)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_content_key_depends_on_all_parts(self):
+        self.assertEqual(content_key("py", "print(1)"), content_key("py", "print(1)"))
+        self.assertNotEqual(content_key("py", "print(1)"), content_key("cpp", "print(1)"))
+
+    def test_nocache_marker(self):
+        self.assertTrue(has_nocache_marker("import random  # nocache\nprint(random.random())"))
+        self.assertTrue(has_nocache_marker("// NOCACHE\nint main() {}"))
+        self.assertFalse(has_nocache_marker("print('cache me')"))
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from bot.cogs.utils import db, metrics
+
+
+class InstrumentedConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        patcher = mock.patch.object(metrics, "REGISTRY", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.conn = mock.Mock()
+        self.conn.execute = mock.AsyncMock(return_value="UPDATE 3")
+        self.conn.fetch = mock.AsyncMock(return_value=[1, 2])
+
+    def test_queries_are_labelled_with_the_table_method(self):
+        class Things(db.Table):
+            async def rename(self):
+                return await db.InstrumentedConnection(self.db).execute("UPDATE things SET name = $1", "x")
+
+        asyncio.run(Things(self.conn).rename())
+
+        self.assertEqual(self.registry.histogram("db_query_seconds", statement="Things.rename").count, 1)
+        self.assertEqual(self.registry.counter("db_query_rows", statement="Things.rename").value, 3)
+
+    def test_rows_of_fetch_are_counted(self):
+        conn = db.InstrumentedConnection(self.conn)
+
+        asyncio.run(conn.fetch("SELECT 1"))
+
+        self.assertEqual(self.registry.counter("db_query_rows", statement="<unknown>").value, 2)
+
+    def test_slow_queries_are_logged_without_parameters(self):
+        conn = db.InstrumentedConnection(self.conn)
+
+        with mock.patch.object(db, "SLOW_QUERY_MS", 0), self.assertLogs(db.log, "WARNING") as logs:
+            asyncio.run(conn.execute("UPDATE users SET name = $1", "secret"))
+
+        self.assertIn("$1=<str>", logs.output[0])
+        self.assertNotIn("secret", logs.output[0])
+
+
+class StatementCacheTests(unittest.TestCase):
+    def test_cached_statements_are_never_expired(self):
+        with mock.patch.object(db.asyncpg, "create_pool", mock.AsyncMock()) as create_pool:
+            asyncio.run(db.Database.create("postgres://"))
+
+        self.assertEqual(create_pool.await_args.kwargs["max_cached_statement_lifetime"], 0)
+        self.assertNotIn("init", create_pool.await_args.kwargs)
+
+
+class LeaderboardLookupTests(unittest.TestCase):
+    def test_invalidated_statement_on_the_lookup_is_retried(self):
+        conn = mock.Mock()
+        conn.fetch = mock.AsyncMock(side_effect=[db.asyncpg.InvalidCachedStatementError("cached plan must not change result type"),
+                                                 [1, 2]])
+
+        rows = asyncio.run(db.Leaderboard.fetch_lookup(conn, "SELECT * FROM ldb_lookup LIMIT 10"))
+
+        self.assertEqual(rows, [1, 2])
+        self.assertEqual(conn.fetch.await_count, 2)
+
+
+class MessagesPartitionTests(unittest.TestCase):
+    def test_partition_is_ensured_once_per_month(self):
+        from datetime import datetime
+
+        conn = mock.Mock()
+        conn.execute = mock.AsyncMock()
+        messages = db.Messages(mock.Mock())
+        rows = [(1, 2, 3, "a", datetime(2020, 10, 1, 12), None),
+                (1, 2, 4, "b", datetime(2020, 10, 31, 23), None),
+                (1, 2, 5, "c", datetime(2020, 11, 1), None)]
+
+        asyncio.run(messages.ensure_partitions(conn, rows))
+        asyncio.run(messages.ensure_partitions(conn, rows))
+
+        months = sorted(call.args[1] for call in conn.execute.await_args_list)
+        self.assertEqual(months, [datetime(2020, 10, 1), datetime(2020, 11, 1)])
@@ -0,0 +1,26 @@
+import unittest
+
+import emoji
+
+from bot.cogs.utils import emotes
+
+
+class EmoteExtractorTests(unittest.TestCase):
+    def setUp(self):
+        self.extractor = emotes.extractor()
+
+    def test_names_match_demojize(self):
+        for text in ("👍", "👍🏽", "❤️", "❤", "🇨🇿", "1️⃣", "👨‍👩‍👧", "🧝🏾"):
+            with self.subTest(text=text):
+                self.assertEqual(self.extractor.findall(text), [emoji.demojize(text)])
+
+    def test_custom_and_typed_emoji(self):
+        text = "ahoj <:pepe:601085412343> <a:kekw:601085412344> :hyperjoseph: ib111 :)"
+        self.assertEqual(self.extractor.findall(text), [":pepe:", ":kekw:", ":hyperjoseph:"])
+
+    def test_longest_sequence_wins(self):
+        self.assertEqual(self.extractor.count("👍🏽👍👍🏽"), {":thumbs_up_medium_skin_tone:": 2, ":thumbs_up:": 1})
+
+    def test_first(self):
+        self.assertEqual(self.extractor.first("nothing here"), None)
+        self.assertEqual(self.extractor.first("top 🔥 and 👍"), ":fire:")
@@ -0,0 +1,175 @@
+import queue
+import asyncio
+import unittest
+from unittest import mock
+from datetime import datetime
+
+import asyncpg
+
+from bot.cogs.utils import ingest
+from bot.cogs.utils.db import Database
+
+
+def payload(id, content="hi :)", author_id=1):
+    return ingest.MessagePayload(
+        id=id, channel=ingest.ChannelRef(10),
+        author=ingest.AuthorPayload(author_id, "author", "https://avatar", datetime(2020, 1, 1)),
+        content=content, created_at=datetime(2021, 3, 1), edited_at=None,
+        attachments=(ingest.AttachmentPayload(5, "a.png", "https://a.png"),),
+        reactions=(ingest.ReactionPayload(id, "👍", (1, 2)),))
+
+
+class IngestorTests(unittest.TestCase):
+    def setUp(self):
+        self.db = Database(mock.MagicMock())
+        self.written = []
+        for table in ("channels", "members", "messages", "attachments", "reactions", "emojis"):
+            getattr(self.db, table).insert = self.recorder(table)
+        self.db.messages.update = self.recorder("messages.update")
+        self.db.messages.soft_delete = self.recorder("messages.soft_delete")
+
+    def recorder(self, name):
+        async def insert(rows):
+            self.written.append((name, list(rows)))
+        return insert
+
+    def test_backfill_rows_are_written_users_first(self):
+        async def main():
+            ingestor = ingest.Ingestor(self.db)
+            await ingestor.add("backfill", payload(100))
+            await ingestor.add("delete", (100, datetime(2021, 3, 1)))
+            await ingestor.flush()
+            return ingestor
+
+        ingestor = asyncio.run(main())
+
+        self.assertEqual([name for name, _ in self.written],
+                         ["members", "messages", "attachments", "reactions", "messages.soft_delete"])
+        self.assertEqual(dict(self.written)["reactions"], [(100, ":thumbs_up:", [1, 2])])
+        self.assertEqual(ingestor.size, 0)
+
+    def test_flush_is_acknowledged_after_the_writes(self):
+        inbox, acks = queue.Queue(), queue.Queue()
+        inbox.put(("message", payload(100)))
+        inbox.put(("flush", 7))
+        inbox.put(ingest.STOP)
+
+        asyncio.run(ingest.Ingestor(self.db).serve(inbox, acks))
+
+        self.assertEqual(self.written, [
+            ("members", [(1, "author", "https://avatar", datetime(2020, 1, 1))]),
+            ("messages", [(10, 1, 100, "hi :)", datetime(2021, 3, 1), None)])])
+        self.assertEqual(acks.get_nowait(), (7, True))
+
+    def test_parent_rows_are_written_before_the_messages(self):
+        async def main():
+            ingestor = ingest.Ingestor(self.db)
+            await ingestor.add("message", payload(100))
+            await ingestor.add("rows", ("channels.insert", [(1, None, 10, "general", 0, datetime(2020, 1, 1))]))
+            await ingestor.flush()
+
+        asyncio.run(main())
+
+        self.assertEqual([name for name, _ in self.written], ["members", "channels", "messages"])
+
+    def test_bad_row_only_loses_itself(self):
+        async def insert(rows):
+            if any(row[2] == 101 for row in rows):
+                raise asyncpg.ForeignKeyViolationError("bad row")
+            self.written.append(("messages", list(rows)))
+        self.db.messages.insert = insert
+
+        inbox, acks = queue.Queue(), queue.Queue()
+        for id in (100, 101, 102):
+            inbox.put(("message", payload(id)))
+        inbox.put(("flush", 1))
+        inbox.put(("message", payload(103)))
+        inbox.put(("flush", 2))
+        inbox.put(ingest.STOP)
+
+        asyncio.run(ingest.Ingestor(self.db).serve(inbox, acks))
+
+        messages = [row[2] for name, rows in self.written if name == "messages" for row in rows]
+        self.assertEqual(messages, [100, 102, 103])
+        self.assertEqual([acks.get_nowait(), acks.get_nowait()], [(1, False), (2, True)])
+
+    def test_client_waits_for_the_acknowledgement(self):
+        inbox, acks = queue.Queue(), queue.Queue()
+        client = ingest.IngestClient(inbox, acks)
+
+        async def main():
+            flush = asyncio.ensure_future(client.flush())
+            await asyncio.sleep(0.05)
+            self.assertFalse(flush.done())
+
+            kind, token = inbox.get_nowait()
+            acks.put((token, True))
+            await asyncio.wait_for(flush, 1)
+            acks.put(ingest.STOP)
+            await client.reader
+
+        asyncio.run(main())
+
+    def test_client_raises_when_the_writes_failed(self):
+        inbox, acks = queue.Queue(), queue.Queue()
+        client = ingest.IngestClient(inbox, acks)
+
+        async def main():
+            flush = asyncio.ensure_future(client.flush())
+            await asyncio.sleep(0.05)
+            kind, token = inbox.get_nowait()
+            acks.put((token, False))
+            with self.assertRaises(ingest.IngestError):
+                await asyncio.wait_for(flush, 1)
+            acks.put(ingest.STOP)
+            await client.reader
+
+        asyncio.run(main())
+
+    def test_client_raises_when_the_worker_is_dead(self):
+        client = ingest.IngestClient(queue.Queue(), queue.Queue(), mock.Mock(is_alive=lambda: False, exitcode=1))
+
+        with self.assertRaises(ingest.IngestError):
+            asyncio.run(client.send("message", payload(100)))
+
+    def test_authors_are_written_once(self):
+        async def main():
+            ingestor = ingest.Ingestor(self.db)
+            for id in range(100, 110):
+                await ingestor.add("backfill", payload(id, author_id=id % 2))
+            await ingestor.flush()
+            await ingestor.add("backfill", payload(110, author_id=1))
+            await ingestor.flush()
+
+        asyncio.run(main())
+
+        users = [row.id for name, rows in self.written if name == "members" for row in rows]
+        self.assertEqual(users, [0, 1])
+
+    def test_renamed_author_is_written_again(self):
+        author = ingest.AuthorPayload(1, "renamed", "https://avatar", datetime(2020, 1, 1))
+        renamed = payload(101)._replace(author=author)
+
+        async def main():
+            ingestor = ingest.Ingestor(self.db)
+            await ingestor.add("backfill", payload(100))
+            await ingestor.add("backfill", renamed)
+            await ingestor.flush()
+
+        asyncio.run(main())
+
+        self.assertEqual([row.name for row in dict(self.written)["members"]], ["author", "renamed"])
+
+    def test_author_reverted_to_an_old_name_is_written_again(self):
+        def renamed(id, name):
+            return payload(id)._replace(author=ingest.AuthorPayload(1, name, "https://avatar", datetime(2020, 1, 1)))
+
+        async def main():
+            ingestor = ingest.Ingestor(self.db)
+            for id, name in ((100, "author"), (101, "renamed"), (102, "author"), (103, "author")):
+                await ingestor.add("backfill", renamed(id, name))
+            await ingestor.flush()
+
+        asyncio.run(main())
+
+        self.assertEqual([row.name for row in dict(self.written)["members"]], ["author", "renamed", "author"])
@@ -0,0 +1,33 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from bot.cogs.utils.paginator import KeysetPages
+
+
+class KeysetPagesTests(unittest.TestCase):
+    def setUp(self):
+        self.rows = list(range(25))
+        self.ctx = mock.Mock()
+
+    async def fetch(self, last, limit):
+        start = self.rows.index(last) + 1
+        return self.rows[start:start + limit]
+
+    def test_rows_are_fetched_one_page_ahead(self):
+        pages = KeysetPages(self.ctx, fetch=self.fetch, first_rows=self.rows[:11], format_entry=str, per_page=10)
+
+        asyncio.run(pages.load(2))
+
+        self.assertEqual(pages.rows, self.rows[:21])
+        self.assertEqual(pages.maximum_pages, 3)
+        self.assertFalse(pages.exhausted)
+        self.assertEqual(pages.get_page(2), [str(row) for row in range(10, 20)])
+
+    def test_last_page_marks_pages_exhausted(self):
+        pages = KeysetPages(self.ctx, fetch=self.fetch, first_rows=self.rows[:11], format_entry=str, per_page=10)
+
+        asyncio.run(pages.load(3))
+
+        self.assertTrue(pages.exhausted)
+        self.assertEqual(pages.maximum_pages, 3)
@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+
+from bot.cogs.utils.router import EventRouter, route
+
+
+class RoutedCog:
+    @route("raw_reaction_add", channels=[1, 2])
+    async def on_raw_reaction_add(self, payload):
+        pass
+
+    @route("message", channels=[2])
+    async def on_message(self, message):
+        pass
+
+
+class EventRouterTests(unittest.TestCase):
+    def setUp(self):
+        self.router = EventRouter()
+        self.cog = RoutedCog()
+        self.router.add_cog(self.cog)
+
+    def test_handlers_are_found_by_channel(self):
+        payload = mock.Mock(channel_id=1)
+
+        self.assertEqual(self.router.handlers("raw_reaction_add", payload), [self.cog.on_raw_reaction_add])
+
+    def test_other_channels_reach_no_handler(self):
+        self.assertFalse(self.router.handlers("raw_reaction_add", mock.Mock(channel_id=3)))
+        self.assertFalse(self.router.handlers("message", mock.Mock(channel=mock.Mock(id=1))))
+
+    def test_unrouted_events_reach_no_handler(self):
+        self.assertFalse(self.router.handlers("raw_reaction_remove", mock.Mock(channel_id=1)))
+        self.assertFalse(self.router.handlers("member_join", mock.Mock()))
+
+    def test_removed_cog_is_unsubscribed(self):
+        self.router.remove_cog(self.cog)
+
+        self.assertFalse(self.router.handlers("raw_reaction_add", mock.Mock(channel_id=1)))
+        self.assertFalse(self.router.handlers("message", mock.Mock(channel=mock.Mock(id=2))))
+
+    def test_unknown_event_can_not_be_routed(self):
+        with self.assertRaises(ValueError):
+            route("typing", channels=[1])
@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+
+from bot.cogs.utils import scheduler
+
+
+class BackgroundSchedulerTests(unittest.TestCase):
+    def test_jobs_run_in_order_of_priority(self):
+        ran = []
+
+        def job(name):
+            async def run():
+                ran.append(name)
+            return run
+
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            jobs.submit("backup", job("backup"), priority=scheduler.LOW)
+            jobs.submit("cleanup", job("cleanup"), priority=scheduler.NORMAL)
+            jobs.submit("urgent", job("urgent"), priority=scheduler.HIGH)
+            jobs.start(asyncio.get_running_loop())
+            await jobs.join()
+            jobs.stop()
+
+        asyncio.run(main())
+
+        self.assertEqual(ran, ["urgent", "cleanup", "backup"])
+
+    def test_failing_job_does_not_stop_the_worker(self):
+        ran = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def succeed():
+            ran.append("ok")
+
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            jobs.submit("fail", fail)
+            jobs.submit("succeed", succeed)
+            jobs.start(asyncio.get_running_loop())
+            await jobs.join()
+            jobs.stop()
+
+        with self.assertLogs(scheduler.log, "ERROR"):
+            asyncio.run(main())
+
+        self.assertEqual(ran, ["ok"])
+
+    def test_job_with_the_same_name_is_queued_once(self):
+        ran = []
+
+        async def backup():
+            ran.append("backup")
+
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            first = jobs.submit("backup", backup)
+            second = jobs.submit("backup", backup)
+            jobs.start(asyncio.get_running_loop())
+            await jobs.join()
+            jobs.stop()
+            return first, second
+
+        first, second = asyncio.run(main())
+
+        self.assertIs(first, second)
+        self.assertEqual(ran, ["backup"])
+
+    def test_cancel_running_job(self):
+        async def forever():
+            await asyncio.sleep(3600)
+
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            jobs.submit("forever", forever)
+            jobs.start(asyncio.get_running_loop())
+            await asyncio.sleep(0.01)
+            self.assertTrue(jobs.jobs["forever"].running)
+
+            self.assertTrue(jobs.cancel("forever"))
+            await jobs.join()
+            self.assertEqual(jobs.jobs, {})
+            jobs.stop()
+
+        asyncio.run(main())
+
+    def test_throttle_waits_for_commands_to_finish(self):
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            with jobs.interactive():
+                throttled = asyncio.ensure_future(jobs.throttle())
+                await asyncio.sleep(0.01)
+                self.assertFalse(throttled.done())
+            await asyncio.wait_for(throttled, timeout=1)
+
+        asyncio.run(main())
+
+    def test_long_low_jobs_do_not_block_the_others(self):
+        async def forever():
+            await asyncio.sleep(3600)
+
+        async def main():
+            ran = asyncio.Event()
+
+            async def urgent():
+                ran.set()
+
+            jobs = scheduler.BackgroundScheduler(slots=3)
+            for shard in range(3):
+                jobs.submit(f"backfill.{shard}", forever, priority=scheduler.LOW)
+            jobs.start(asyncio.get_running_loop())
+            await asyncio.sleep(0.01)
+            # the last slot stays free for the other jobs
+            self.assertEqual(len(jobs.running), 2)
+
+            jobs.submit("urgent", urgent, priority=scheduler.HIGH)
+            await asyncio.wait_for(ran.wait(), timeout=1)
+            jobs.stop()
+
+        asyncio.run(main())
+
+    def test_long_command_pauses_the_jobs_only_for_the_grace_period(self):
+        async def main():
+            jobs = scheduler.BackgroundScheduler()
+            with jobs.interactive(grace=0.05):
+                throttled = asyncio.ensure_future(jobs.throttle())
+                await asyncio.sleep(0.01)
+                self.assertFalse(throttled.done())
+                await asyncio.wait_for(throttled, timeout=1)
+            self.assertEqual(jobs.commands_running, 0)
+
+        asyncio.run(main())
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_delay_once_the_burst_is_spent(self):
+        now = [0.0]
+        bucket = scheduler.TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+
+        self.assertEqual(bucket.delay(), 0.0)
+        self.assertEqual(bucket.delay(), 0.0)
+        self.assertEqual(bucket.delay(), 0.5)
+
+        now[0] = 1.5
+        self.assertEqual(bucket.delay(), 0.0)
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from discord.ext import commands
+
+from bot.bot import MasarykBOT
+
+
+async def ping(ctx):
+    pass
+
+
+class ProcessCommandsTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.bot = MasarykBOT(command_prefix=commands.when_mentioned_or("!"))
+        self.bot._connection.user = mock.Mock(id=42, mention="<@42>")
+        self.bot.add_command(commands.Command(ping, name="ping", aliases=["p"]))
+
+    async def test_plain_chat_is_not_a_command(self):
+        message = mock.Mock(content="hello there")
+        self.assertFalse(await self.bot.is_possible_command(message))
+
+    async def test_unknown_command_is_not_a_command(self):
+        message = mock.Mock(content="!pong")
+        self.assertFalse(await self.bot.is_possible_command(message))
+
+    async def test_known_commands_and_aliases_are_commands(self):
+        for content in ("!ping", "!p", "!ping now", "<@42> ping", "<@!42> p"):
+            with self.subTest(content=content):
+                self.assertTrue(await self.bot.is_possible_command(mock.Mock(content=content)))
+
+    async def test_space_after_the_prefix_is_not_a_command(self):
+        self.assertFalse(await self.bot.is_possible_command(mock.Mock(content="! ping now")))
+
+        self.bot.strip_after_prefix = True
+        self.assertTrue(await self.bot.is_possible_command(mock.Mock(content="! ping now")))
+
+    async def test_plain_chat_skips_the_context(self):
+        message = mock.Mock(content="hello there")
+        with mock.patch.object(self.bot, "get_context") as get_context:
+            await self.bot.process_commands(message)
+        get_context.assert_not_called()
+
+
+class ShardTests(unittest.TestCase):
+    def setUp(self):
+        self.bot = MasarykBOT.__new__(MasarykBOT)
+        self.bot.shard_health = {}
+
+    def test_shard_guilds_filters_by_shard(self):
+        guilds = [mock.Mock(shard_id=0), mock.Mock(shard_id=1), mock.Mock(shard_id=0)]
+        with mock.patch.object(MasarykBOT, "guilds", guilds):
+            self.assertEqual(self.bot.shard_guilds(0), [guilds[0], guilds[2]])
+            self.assertEqual(self.bot.shard_guilds(), guilds)
+
+    def test_disconnects_are_counted(self):
+        asyncio.run(self.bot.on_shard_connect(1))
+        asyncio.run(self.bot.on_shard_disconnect(1))
+        asyncio.run(self.bot.on_shard_resumed(1))
+
+        health = self.bot.get_shard_health(1)
+        self.assertEqual((health.status, health.disconnects), ("ready", 1))
@@ -0,0 +1,25 @@
+import asyncio
+import logging
+import unittest
+from unittest import mock
+
+from bot import __main__ as main
+
+
+class ImportExtensionsTests(unittest.TestCase):
+    def test_failed_imports_are_logged(self):
+        async def import_extensions():
+            await main.import_extensions(asyncio.get_running_loop())
+
+        def import_module(name):
+            if name == "bot.cogs.broken":
+                raise SyntaxError("invalid syntax")
+
+        with mock.patch.object(main, "initail_cogs", ["bot.cogs.fine", "bot.cogs.broken"]), \
+                mock.patch.object(main.importlib, "import_module", import_module), \
+                self.assertLogs(logging.getLogger(), "ERROR") as logs:
+            asyncio.run(import_extensions())
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("bot.cogs.broken", logs.output[0])
+        self.assertIsInstance(logs.records[0].exc_info[1], SyntaxError)
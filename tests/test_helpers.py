@@ -44,8 +44,8 @@ class DiscordMocksTests(unittest.TestCase):
         """Tests if MockBot initializes with the correct values."""
         bot = helpers.MockBot()
 
-        # The `spec` argument makes sure `isistance` checks with `discord.ext.commands.Bot` pass
-        self.assertIsInstance(bot, discord.ext.commands.Bot)
+        # The `spec` argument makes sure `isistance` checks with `discord.ext.commands.AutoShardedBot` pass
+        self.assertIsInstance(bot, discord.ext.commands.AutoShardedBot)
 
     def test_mock_context_default_initialization(self):
         """Tests if MockContext initializes with the correct values."""